@@ -134,4 +134,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'face_attendance:login'
 LOGIN_REDIRECT_URL = 'face_attendance:dashboard'
-LOGOUT_REDIRECT_URL = 'face_attendance:index'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'face_attendance:index'
+
+# Face recognition
+# Seconds between checks of the face gallery change log (0 = before every match)
+FACE_GALLERY_SYNC_INTERVAL = 0
+# Seconds gallery change-log rows are kept; a process idle for longer reloads the gallery
+FACE_GALLERY_CHANGE_RETENTION = 24 * 3600
+
+# Nearest-neighbour index for the gallery: 'brute' (exact) or 'ivf' (approximate).
+# Build the IVF index with `python manage.py build_face_index`; a larger
+# FACE_INDEX_N_PROBE raises recall at the cost of latency.
+FACE_INDEX_BACKEND = 'brute'
+FACE_INDEX_N_LISTS = 0  # 0 = about sqrt(number of encodings)
+FACE_INDEX_N_PROBE = 8
+FACE_INDEX_PATH = os.path.join(BASE_DIR, 'face_index', 'ivf.npz')
+
+# How each employee's stored encodings are matched: 'primary' (primary encoding
+# only), 'centroid' (mean of the newest FACE_MATCH_K) or 'min' (best of the
+# newest FACE_MATCH_K)
+FACE_MATCH_STRATEGY = 'min'
+FACE_MATCH_K = 3
+
+# Maximum frames accepted by one batch recognition request
+FACE_BATCH_MAX_FRAMES = 10
+
+# Recognition worker pool: processes holding the dlib models (0 = run inline in
+# the request thread), jobs allowed to queue before requests get a 503, and the
+# per-request wait in seconds before a 504
+FACE_WORKER_PROCESSES = 2
+FACE_WORKER_QUEUE_SIZE = 16
+FACE_WORKER_TIMEOUT = 10.0
+
+# Frames are downscaled so their longest side is at most this many pixels before
+# face detection (per-camera detection_scale overrides it); faces are still
+# encoded from full-resolution crops
+FACE_DETECTION_MAX_SIDE = 480
+
+# Server-side camera ingestion (`python manage.py run_cameras`): recognise every
+# Nth frame, keep at most this many decoded frames per camera (older ones are
+# dropped), and ignore an employee for this many seconds after each sighting
+FACE_CAMERA_SAMPLE_EVERY = 5
+FACE_CAMERA_BUFFER_SIZE = 4
+FACE_CAMERA_COOLDOWN = 300
+
+# Camera frame gate: skip face detection when less than this share of pixels
+# changed since the previous sampled frame (0 = no motion check) or when mean
+# brightness is outside the range; faces whose Laplacian variance is below
+# FACE_GATE_MIN_SHARPNESS are treated as blurred and not encoded
+FACE_GATE_MOTION_THRESHOLD = 0.002
+FACE_GATE_MIN_BRIGHTNESS = 40
+FACE_GATE_MAX_BRIGHTNESS = 220
+FACE_GATE_MIN_SHARPNESS = 20.0
+
+# Cascade XML files for the per-camera first-pass detector. 'haar' defaults to
+# OpenCV's bundled haarcascade_frontalface_default.xml; 'lbp' needs a path, e.g.
+# lbpcascade_frontalface_improved.xml from the opencv repository
+FACE_CASCADE_PATHS = {
+    'haar': None,
+    'lbp': None,
+}
+
+# Seconds a kiosk recognition response is reused for a resubmitted, identical
+# frame (0 = off). Uses the default cache; configure a shared CACHES backend
+# (e.g. Redis) when several server processes serve the kiosks
+FACE_RECOGNITION_CACHE_TTL = 5
+
+# A recognition this many seconds after a check-in (or check-out) repeats that
+# event instead of recording the next one
+FACE_ATTENDANCE_REPEAT_WINDOW = 60
+
+# How recognitions are stored: 'upsert' writes AttendanceRecord directly;
+# 'events' only appends AttendanceEvent punches (insert-only, several in/out
+# pairs a day) and `python manage.py rollup_attendance` folds them into
+# AttendanceRecord. Punches younger than ATTENDANCE_ROLLUP_LAG seconds wait
+# for the next roll-up
+ATTENDANCE_WRITE_MODE = 'upsert'
+ATTENDANCE_ROLLUP_LAG = 5
+
+# Write-behind buffer for 'events' mode: punches are fsync'd to a spool file in
+# ATTENDANCE_SPOOL_DIR and answered at once, then inserted with one bulk_create
+# when ATTENDANCE_BUFFER_MAX_SIZE are queued or the oldest has waited
+# ATTENDANCE_BUFFER_MAX_DELAY seconds. Spools of crashed processes are replayed
+# on the next start
+ATTENDANCE_WRITE_BEHIND = False
+ATTENDANCE_SPOOL_DIR = os.path.join(BASE_DIR, 'spool')
+ATTENDANCE_BUFFER_MAX_SIZE = 200
+ATTENDANCE_BUFFER_MAX_DELAY = 1.0
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
-    Department, Employee, FaceEncoding, Shift, AttendanceRecord,
-    PayRate, EmployeePayInfo, PayPeriod, Payroll
+    Department, Employee, FaceEncoding, Shift, AttendanceRecord, AttendanceEvent,
+    PayRate, EmployeePayInfo, PayPeriod, Payroll, CameraConfiguration
 )
 
 @admin.register(Department)
@@ -32,6 +32,12 @@ class AttendanceRecordAdmin(admin.ModelAdmin):
     search_fields = ('employee__first_name', 'employee__last_name', 'employee__employee_id')
     date_hierarchy = 'date'
 
+@admin.register(AttendanceEvent)
+class AttendanceEventAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'timestamp', 'camera', 'distance')
+    list_filter = ('camera',)
+    search_fields = ('employee__first_name', 'employee__last_name')
+
 @admin.register(PayRate)
 class PayRateAdmin(admin.ModelAdmin):
     list_display = ('position', 'hourly_rate', 'overtime_rate')
@@ -48,4 +54,9 @@ class PayPeriodAdmin(admin.ModelAdmin):
 class PayrollAdmin(admin.ModelAdmin):
     list_display = ('employee', 'pay_period', 'regular_hours', 'overtime_hours', 'gross_pay', 'net_pay', 'status')
     list_filter = ('status', 'pay_period')
-    search_fields = ('employee__first_name', 'employee__last_name')
\ No newline at end of file
+    search_fields = ('employee__first_name', 'employee__last_name')
+
+@admin.register(CameraConfiguration)
+class CameraConfigurationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'camera_source', 'threshold', 'department', 'detection_scale', 'detector_model', 'detector_upsample', 'detector_cascade')
+    list_filter = ('department',)
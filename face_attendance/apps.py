@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FaceAttendaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'face_attendance'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,318 @@
+"""
+Attendance writes shared by the kiosk views, the desktop capture and the
+camera pipeline.
+
+On PostgreSQL a check-in or check-out is one ``INSERT ... ON CONFLICT
+(employee_id, date) DO UPDATE`` statement that also computes hours_worked
+and work_units, so concurrent kiosks cannot race on the (employee, date)
+constraint. Other databases take a row lock inside a transaction instead.
+
+A recognition within FACE_ATTENDANCE_REPEAT_WINDOW seconds of the last
+check-in or check-out repeats that event instead of recording the next one.
+Double taps and client retries therefore never turn a check-in into an
+immediate check-out.
+
+With ATTENDANCE_WRITE_MODE = 'events' a recognition only appends an
+AttendanceEvent punch. ``rollup_events`` (the rollup_attendance command)
+later folds each day's punches into AttendanceRecord. Punches alternate
+check-in/check-out, so there can be several pairs a day. With
+ATTENDANCE_WRITE_BEHIND the punches go through punch_buffer instead of being
+inserted before the kiosk is answered.
+"""
+import datetime
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import attendance_summary
+from .models import AttendanceEvent, AttendanceRecord, AttendanceRollupCheckpoint
+from .punch_buffer import get_buffer, write_behind
+
+WRITE_MODES = ('upsert', 'events')
+ROLLUP_CHECKPOINT = 'attendance'
+
+# Seconds to hours and hours to work units (1 công = 8 giờ), rounded like calculate_hours
+_HOURS_SQL = 'ROUND((EXTRACT(EPOCH FROM (EXCLUDED.check_in_time - t.check_in_time)) / 3600)::numeric, 2)'
+
+_UPSERT_SQL = f'''
+INSERT INTO {{table}} AS t
+    (employee_id, date, check_in_time, status, verification_method, hours_worked, work_units)
+VALUES (%(employee_id)s, %(date)s, %(now)s, 'present', 'face', 0, 0)
+ON CONFLICT (employee_id, date) DO UPDATE SET
+    check_out_time = EXCLUDED.check_in_time,
+    hours_worked = {_HOURS_SQL},
+    work_units = ROUND({_HOURS_SQL} / 8, 2)
+WHERE t.check_out_time IS NULL
+    AND t.check_in_time IS NOT NULL
+    AND EXCLUDED.check_in_time - t.check_in_time >= %(window)s
+RETURNING {{columns}}
+'''
+
+
+def repeat_window():
+    return datetime.timedelta(seconds=getattr(settings, 'FACE_ATTENDANCE_REPEAT_WINDOW', 60))
+
+
+def write_mode():
+    mode = getattr(settings, 'ATTENDANCE_WRITE_MODE', 'upsert')
+    if mode not in WRITE_MODES:
+        raise ValueError(f'ATTENDANCE_WRITE_MODE must be one of {WRITE_MODES}, not {mode!r}')
+    return mode
+
+
+def _repeated_action(attendance, now):
+    """The action ``now`` would merely repeat, if it falls inside the repeat window"""
+    last_action, last_time = 'check_in', attendance.check_in_time
+    if attendance.check_out_time is not None:
+        last_action, last_time = 'check_out', attendance.check_out_time
+    if last_time is not None and now - last_time < repeat_window():
+        return last_action
+    return None
+
+
+def _upsert_postgresql(connection, employee, now):
+    meta = AttendanceRecord._meta
+    fields = meta.concrete_fields
+    sql = _UPSERT_SQL.format(
+        table=connection.ops.quote_name(meta.db_table),
+        columns=', '.join(f't.{connection.ops.quote_name(field.column)}' for field in fields),
+    )
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'employee_id': employee.pk, 'date': now.date(), 'now': now, 'window': repeat_window(),
+            })
+            row = cursor.fetchone()
+        if row is None:
+            # The WHERE clause kept the row as it was: already checked out, or a repeat
+            return None
+        attendance = AttendanceRecord.from_db(connection.alias, [field.attname for field in fields], row)
+        # Raw SQL sends no post_save signal. A check-in adds the record; a
+        # check-out adds its hours (an open record has none yet)
+        deltas = attendance_summary.SummaryDeltas()
+        deltas.departments[employee.pk] = employee.department_id
+        values = attendance_summary.contribution(attendance)
+        if attendance.check_out_time is not None:
+            values = (0, 0, *values[2:])
+        deltas.add(employee.pk, attendance.date, values)
+        deltas.apply()
+    return attendance
+
+
+def _acknowledged(action, attendance):
+    """(action, attendance, time of the check-in or check-out that ``action`` acknowledges)"""
+    punch_time = {'check_in': attendance.check_in_time, 'check_out': attendance.check_out_time}.get(action)
+    return action, attendance, punch_time
+
+
+def _record_locked(employee, now, using):
+    with transaction.atomic(using=using):
+        attendance, created = AttendanceRecord.objects.using(using).select_for_update().get_or_create(
+            employee=employee,
+            date=now.date(),
+            defaults={
+                'check_in_time': now,
+                'status': 'present',
+                'verification_method': 'face'
+            }
+        )
+        if created:
+            return _acknowledged('check_in', attendance)
+        if attendance.check_out_time is None and attendance.check_in_time is not None \
+                and _repeated_action(attendance, now) is None:
+            attendance.check_out_time = now
+            attendance.calculate_hours(commit=False)
+            attendance.save(update_fields=['check_out_time', 'hours_worked', 'work_units'])
+            return _acknowledged('check_out', attendance)
+    return _acknowledged(_repeated_action(attendance, now), attendance)
+
+
+def _upsert_attendance(employee, now):
+    using = router.db_for_write(AttendanceRecord)
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return _record_locked(employee, now, using)
+
+    attendance = _upsert_postgresql(connection, employee, now)
+    if attendance is not None:
+        return _acknowledged('check_in' if attendance.check_out_time is None else 'check_out', attendance)
+    attendance = AttendanceRecord.objects.using(using).get(employee=employee, date=now.date())
+    return _acknowledged(_repeated_action(attendance, now), attendance)
+
+
+def _day_bounds(date):
+    start = datetime.datetime.combine(date, datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+def fold_punches(timestamps):
+    """
+    Fold one employee-day of punch times.
+    Returns (kept, hours): ``kept`` are the punches left after dropping
+    repeats inside the repeat window, alternating check-in/check-out;
+    ``hours`` sums every completed pair.
+    """
+    window = repeat_window()
+    kept = []
+    for timestamp in sorted(timestamps):
+        if not kept or timestamp - kept[-1] >= window:
+            kept.append(timestamp)
+    seconds = sum((out - in_).total_seconds() for in_, out in zip(kept[0::2], kept[1::2]))
+    return kept, round(seconds / 3600, 2)
+
+
+def folded_record(employee_id, date, timestamps, record=None):
+    """AttendanceRecord (``record`` updated in place, or a new unsaved one) for a day of punches"""
+    kept, hours = fold_punches(timestamps)
+    record = record or AttendanceRecord(employee_id=employee_id, date=date)
+    record.check_in_time = kept[0] if kept else None
+    # The last completed pair's check-out; an odd punch count means checked in again
+    record.check_out_time = kept[len(kept) // 2 * 2 - 1] if len(kept) >= 2 else None
+    record.status = 'present'
+    record.verification_method = 'face'
+    record.hours_worked = hours
+    record.work_units = round(hours / 8, 2)
+    return record
+
+
+def _punch_action(timestamps, now):
+    """
+    ('check_in'/'check_out', time) of the punch at ``now``, or of the kept
+    punch it repeats. The folded record only holds the day's first check-in,
+    so a later check-in's time comes from here.
+    """
+    kept, _ = fold_punches(timestamps)
+    index = sum(1 for timestamp in kept if timestamp <= now) - 1
+    return ('check_in' if index % 2 == 0 else 'check_out'), kept[index]
+
+
+def _append_events(matches, now, camera):
+    """Insert one punch per (employee, distance) and derive each employee's action from today's punches"""
+    new_punches = [
+        {'employee_id': employee.pk, 'camera_id': camera.pk if camera else None, 'timestamp': now, 'distance': distance}
+        for employee, distance in matches
+    ]
+    employee_ids = {punch['employee_id'] for punch in new_punches}
+    start, end = _day_bounds(now.date())
+    buffered = []
+    if write_behind():
+        buffer = get_buffer()
+        buffer.add(new_punches)
+        buffered = buffer.pending_punches(employee_ids, start, end)
+    else:
+        AttendanceEvent.objects.bulk_create([AttendanceEvent(**punch) for punch in new_punches])
+
+    punches = defaultdict(list)
+    stored = AttendanceEvent.objects.filter(
+        employee__in=employee_ids, timestamp__gte=start, timestamp__lt=end,
+    ).values_list('employee_id', 'timestamp')
+    # A punch may briefly be both stored and still queued; fold_punches drops the duplicate
+    for employee_id, timestamp in [*stored, *buffered]:
+        punches[employee_id].append(timestamp)
+
+    results = []
+    for employee, _ in matches:
+        attendance = folded_record(employee.pk, now.date(), punches[employee.pk])
+        attendance.employee = employee
+        action, punch_time = _punch_action(punches[employee.pk], now)
+        results.append((action, attendance, punch_time))
+    return results
+
+
+def record_face_attendance(employee, now, camera=None, distance=None):
+    """
+    Check the employee in, or out if already checked in today.
+    Returns (action, attendance, punch_time) where action is 'check_in',
+    'check_out' (also for a repeat inside the repeat window) or None when both
+    times are already recorded, and punch_time is the time of the check-in or
+    check-out acknowledged (None with no action). In 'events' mode
+    ``attendance`` is an unsaved record folded from today's punches.
+    """
+    if write_mode() == 'events':
+        return _append_events([(employee, distance)], now, camera)[0]
+    return _upsert_attendance(employee, now)
+
+
+def record_face_attendance_many(matches, now, camera=None):
+    """
+    record_face_attendance for several (employee, distance) pairs at once:
+    one bulk insert in 'events' mode, one transaction otherwise.
+    """
+    if not matches:
+        return []
+    if write_mode() == 'events':
+        return _append_events(matches, now, camera)
+    with transaction.atomic():
+        return [_upsert_attendance(employee, now) for employee, _ in matches]
+
+
+async def arecord_face_attendance(employee, now, camera=None, distance=None):
+    """Async counterpart of record_face_attendance (runs it in the sync thread)"""
+    return await sync_to_async(record_face_attendance)(employee, now, camera, distance)
+
+
+def rollup_events(batch_size=5000, name=ROLLUP_CHECKPOINT):
+    """
+    Fold the next batch of punches into AttendanceRecord.
+    Every day touched by a new punch is recomputed from all of that day's
+    punches, so re-running is harmless. Punches younger than
+    ATTENDANCE_ROLLUP_LAG seconds wait for the next run, so inserts that
+    commit out of id order are not skipped. Records entered manually
+    or overridden by an admin are left alone.
+    Returns (punches processed, days updated).
+    """
+    lag = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'ATTENDANCE_ROLLUP_LAG', 5))
+    with transaction.atomic():
+        checkpoint, _ = AttendanceRollupCheckpoint.objects.select_for_update().get_or_create(name=name)
+        batch = []
+        for event_id, employee_id, timestamp, created in AttendanceEvent.objects.filter(
+            id__gt=checkpoint.last_event_id
+        ).order_by('id').values_list('id', 'employee_id', 'timestamp', 'created')[:batch_size]:
+            if created >= lag:
+                break
+            batch.append((event_id, employee_id, timestamp))
+        if not batch:
+            return 0, 0
+
+        days = {(employee_id, timestamp.date()) for _, employee_id, timestamp in batch}
+        employee_ids = {employee_id for employee_id, _ in days}
+        dates = {date for _, date in days}
+        start, _ = _day_bounds(min(dates))
+        _, end = _day_bounds(max(dates))
+        punches = defaultdict(list)
+        for employee_id, timestamp in AttendanceEvent.objects.filter(
+            employee_id__in=employee_ids, timestamp__gte=start, timestamp__lt=end,
+        ).values_list('employee_id', 'timestamp'):
+            if (employee_id, timestamp.date()) in days:
+                punches[employee_id, timestamp.date()].append(timestamp)
+
+        existing = {
+            (record.employee_id, record.date): record
+            for record in AttendanceRecord.objects.select_for_update().filter(
+                employee_id__in=employee_ids, date__in=dates
+            )
+        }
+        created_records, updated_records = [], []
+        deltas = attendance_summary.SummaryDeltas()
+        for employee_id, date in days:
+            record = existing.get((employee_id, date))
+            if record is not None and record.verification_method != 'face':
+                continue
+            if record is not None:
+                deltas.add_record(record, sign=-1)  # Before folding updates it in place
+            folded = folded_record(employee_id, date, punches[employee_id, date], record)
+            deltas.add_record(folded)
+            (updated_records if record is not None else created_records).append(folded)
+
+        AttendanceRecord.objects.bulk_create(created_records)
+        AttendanceRecord.objects.bulk_update(updated_records, [
+            'check_in_time', 'check_out_time', 'status', 'verification_method', 'hours_worked', 'work_units',
+        ])
+        # bulk_create/bulk_update send no post_save signals
+        deltas.apply()
+        checkpoint.last_event_id = batch[-1][0]
+        checkpoint.save(update_fields=['last_event_id', 'updated'])
+    return len(batch), len(created_records) + len(updated_records)
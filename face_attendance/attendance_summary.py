@@ -0,0 +1,284 @@
+"""
+Materialised attendance summaries for the reports.
+
+MonthlyAttendanceSummary keeps per-employee monthly totals and
+DailyDepartmentSummary per-department daily counts. Reports read these rows
+instead of scanning AttendanceRecord, so their cost does not grow with the
+attendance history.
+
+Writes keep the summaries current with ``SummaryDeltas``: the change each
+write makes to the counters (a record added, hours added at check-out, a
+record removed) is added to the stored rows by one ``INSERT ... ON CONFLICT
+DO UPDATE SET n = n + delta`` per table. Concurrent writers add to the same
+row instead of overwriting it, and a write never re-reads the attendance
+history. Saving or deleting an AttendanceRecord does this through signals;
+deleting an employee takes all of its records out in one step. Writes that
+bypass signals (the PostgreSQL upsert and the event roll-up) apply their
+deltas explicitly. Daily rows use each employee's current department, so a
+department change moves the employee's daily totals to the new department.
+After loading records with raw SQL, run
+``python manage.py rebuild_attendance_summaries`` for the affected dates.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import AttendanceRecord, DailyDepartmentSummary, Employee, MonthlyAttendanceSummary
+
+# Statuses counted as present on the dashboard
+PRESENT_STATUSES = ('present', 'late')
+# department_key of employees without a department
+NO_DEPARTMENT = 0
+# Summary rows per INSERT when applying deltas
+DELTA_BATCH_SIZE = 200
+
+_TOTAL_FIELD = DecimalField(max_digits=10, decimal_places=2)
+_ZERO = Value(Decimal('0'), output_field=_TOTAL_FIELD)
+
+
+def _totals(present_field):
+    """Aggregates stored in both summary tables, over AttendanceRecord rows"""
+    return {
+        'records': Count('id'),
+        present_field: Count('id', filter=Q(status__in=PRESENT_STATUSES)),
+        'total_hours': Coalesce(Sum('hours_worked', output_field=_TOTAL_FIELD), _ZERO),
+        'total_work_units': Coalesce(Sum('work_units', output_field=_TOTAL_FIELD), _ZERO),
+    }
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(date):
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _as_date(value):
+    return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def contribution(record):
+    """(records, present, hours, work units) that ``record`` adds to its summaries"""
+    # Read through __dict__ so a deferred field does not cost a query
+    fields = record.__dict__
+    return (
+        1,
+        1 if fields.get('status') in PRESENT_STATUSES else 0,
+        Decimal(str(fields.get('hours_worked') or 0)),
+        Decimal(str(fields.get('work_units') or 0)),
+    )
+
+
+def _add_counters(model, key_fields, present_field, rows):
+    """Add {key: (records, present, hours, work units)} to ``model``'s rows, creating missing ones"""
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    counters = ['records', present_field, 'total_hours', 'total_work_units']
+    now = timezone.now()
+
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        for key, values in rows.items():
+            lookup = dict(zip(key_fields, key))
+            increments = {name: F(name) + value for name, value in zip(counters, values)}
+            if model.objects.using(using).filter(**lookup).update(**increments, updated=now):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    model.objects.using(using).create(**lookup, **dict(zip(counters, values)))
+            except IntegrityError:
+                # Created by a concurrent writer since the UPDATE
+                model.objects.using(using).filter(**lookup).update(**increments, updated=now)
+        return
+
+    qn = connection.ops.quote_name
+    columns = [*key_fields, *counters, 'updated']
+    fields = [model._meta.get_field(column) for column in columns]
+    assignments = ', '.join(f'{qn(name)} = t.{qn(name)} + EXCLUDED.{qn(name)}' for name in counters)
+    items = list(rows.items())
+    with connection.cursor() as cursor:
+        for offset in range(0, len(items), DELTA_BATCH_SIZE):
+            chunk = items[offset:offset + DELTA_BATCH_SIZE]
+            placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(chunk))
+            params = [
+                field.get_db_prep_value(value, connection)
+                for key, values in chunk
+                for field, value in zip(fields, (*key, *values, now))
+            ]
+            cursor.execute(
+                f'INSERT INTO {qn(model._meta.db_table)} AS t ({", ".join(qn(column) for column in columns)}) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT ({", ".join(qn(column) for column in key_fields)}) DO UPDATE SET '
+                f'{assignments}, {qn("updated")} = EXCLUDED.{qn("updated")}',
+                params,
+            )
+
+
+def _accumulate(totals, values, sign=1):
+    for index, value in enumerate(values):
+        totals[index] += sign * value
+
+
+def _empty_totals():
+    return [0, 0, Decimal('0'), Decimal('0')]
+
+
+class SummaryDeltas:
+    """Changes to the summaries, collected per (employee_id, date) and written by ``apply``"""
+
+    def __init__(self):
+        self._changes = defaultdict(_empty_totals)
+        # employee_id -> department_id, for the daily rows; looked up by apply when missing
+        self.departments = {}
+
+    def add(self, employee_id, date, values, sign=1):
+        _accumulate(self._changes[employee_id, _as_date(date)], values, sign)
+
+    def add_record(self, record, sign=1):
+        self.add(record.employee_id, record.date, contribution(record), sign)
+
+    def apply(self, monthly=True):
+        """Add the collected deltas to the summary rows; ``monthly=False`` only touches the daily rows"""
+        changes = {key: totals for key, totals in self._changes.items() if any(totals)}
+        self._changes.clear()
+        if not changes:
+            return
+        missing = {employee_id for employee_id, _ in changes} - self.departments.keys()
+        if missing:
+            self.departments.update(Employee.objects.filter(id__in=missing).values_list('id', 'department_id'))
+
+        monthly_rows, daily_rows = defaultdict(_empty_totals), defaultdict(_empty_totals)
+        for (employee_id, date), totals in changes.items():
+            if employee_id not in self.departments:
+                continue  # Employee deleted meanwhile; its summaries went with it
+            if monthly:
+                _accumulate(monthly_rows[employee_id, month_start(date)], totals)
+            _accumulate(daily_rows[date, self.departments[employee_id] or NO_DEPARTMENT], totals)
+        with transaction.atomic():
+            _add_counters(MonthlyAttendanceSummary, ('employee_id', 'month'), 'days_present', monthly_rows)
+            _add_counters(DailyDepartmentSummary, ('date', 'department_key'), 'present', daily_rows)
+
+
+def _add_daily_totals(deltas, employee, sign):
+    """Add all of an employee's records, one grouped row per date, to ``deltas``"""
+    for row in AttendanceRecord.objects.filter(employee=employee).values('date').annotate(
+        **_totals('present')
+    ).order_by():
+        values = (row['records'], row['present'], row['total_hours'], row['total_work_units'])
+        deltas.add(employee.pk, row['date'], values, sign=sign)
+
+
+def forget_employee(employee):
+    """
+    Take an employee's records out of the daily summaries before the
+    employee is deleted; the monthly rows are deleted with the employee.
+    """
+    deltas = SummaryDeltas()
+    deltas.departments[employee.pk] = employee.department_id
+    _add_daily_totals(deltas, employee, sign=-1)
+    deltas.apply(monthly=False)
+
+
+def move_employee(employee, old_department_id):
+    """Move an employee's records from ``old_department_id``'s daily rows to their current department's"""
+    removed, added = SummaryDeltas(), SummaryDeltas()
+    removed.departments[employee.pk] = old_department_id
+    added.departments[employee.pk] = employee.department_id
+    _add_daily_totals(removed, employee, sign=-1)
+    _add_daily_totals(added, employee, sign=1)
+    with transaction.atomic():
+        removed.apply(monthly=False)
+        added.apply(monthly=False)
+
+
+def rebuild(start_date, end_date, chunk_size=1000):
+    """
+    Recompute every summary from AttendanceRecord: daily rows for
+    ``start_date``..``end_date`` and monthly rows for every month they touch.
+    Returns (monthly rows, daily rows) written.
+    """
+    first_month = month_start(_as_date(start_date))
+    end_date = _as_date(end_date)
+    after_month = next_month(end_date)
+
+    monthly = [
+        MonthlyAttendanceSummary(**row)
+        for row in AttendanceRecord.objects.filter(date__gte=first_month, date__lt=after_month)
+        .annotate(month=TruncMonth('date')).values('employee_id', 'month')
+        .annotate(**_totals('days_present')).order_by()
+    ]
+    daily = [
+        DailyDepartmentSummary(department_key=row.pop('employee__department_id') or NO_DEPARTMENT, **row)
+        for row in AttendanceRecord.objects.filter(date__range=(start_date, end_date))
+        .values('date', 'employee__department_id').annotate(**_totals('present')).order_by()
+    ]
+    with transaction.atomic():
+        MonthlyAttendanceSummary.objects.filter(month__gte=first_month, month__lt=after_month).delete()
+        DailyDepartmentSummary.objects.filter(date__range=(start_date, end_date)).delete()
+        MonthlyAttendanceSummary.objects.bulk_create(monthly, batch_size=chunk_size)
+        DailyDepartmentSummary.objects.bulk_create(daily, batch_size=chunk_size)
+    return len(monthly), len(daily)
+
+
+def day_counts(start_date, end_date=None):
+    """{'records', 'present'} summed over all departments for a date or date range"""
+    return DailyDepartmentSummary.objects.filter(
+        date__range=(start_date, end_date or start_date)
+    ).aggregate(
+        records=Coalesce(Sum('records'), 0),
+        present=Coalesce(Sum('present'), 0),
+    )
+
+
+def _sum_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(employee=OuterRef('pk')).values('employee')
+            .annotate(total=Sum(field, output_field=_TOTAL_FIELD)).values('total'),
+            output_field=_TOTAL_FIELD,
+        ),
+        _ZERO,
+        output_field=_TOTAL_FIELD,
+    )
+
+
+def with_summary_totals(employees, start_date, end_date):
+    """
+    Like attendance_totals.with_totals, but whole months inside the range are
+    read from MonthlyAttendanceSummary; only the partial months at its ends
+    are summed from AttendanceRecord.
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    first_full = start_date if start_date.day == 1 else next_month(start_date)
+    after_full = month_start(end_date + datetime.timedelta(days=1))
+    if first_full >= after_full:
+        # No whole month in the range
+        first_full = after_full = None
+        raw_ranges = [(start_date, end_date)]
+    else:
+        raw_ranges = []
+        if start_date < first_full:
+            raw_ranges.append((start_date, first_full - datetime.timedelta(days=1)))
+        if after_full <= end_date:
+            raw_ranges.append((after_full, end_date))
+
+    totals = {'total_hours': _ZERO, 'total_work_units': _ZERO}
+    if first_full is not None:
+        months = MonthlyAttendanceSummary.objects.filter(month__gte=first_full, month__lt=after_full)
+        for name in totals:
+            totals[name] = _sum_subquery(months, name)
+    if raw_ranges:
+        in_ranges = Q()
+        for range_start, range_end in raw_ranges:
+            in_ranges |= Q(date__range=(range_start, range_end))
+        records = AttendanceRecord.objects.filter(in_ranges)
+        totals['total_hours'] = totals['total_hours'] + _sum_subquery(records, 'hours_worked')
+        totals['total_work_units'] = totals['total_work_units'] + _sum_subquery(records, 'work_units')
+    return employees.annotate(**totals)
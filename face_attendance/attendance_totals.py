@@ -0,0 +1,49 @@
+"""
+Attendance totals computed by the database.
+
+Work-unit and salary pages, their CSV exports, Employee/Payroll methods and
+calculate_payroll all total AttendanceRecord.hours_worked and work_units over
+a date range. ``with_totals`` adds those totals to an Employee queryset as
+one grouped query (LEFT JOIN + SUM, 0 for employees without records) instead
+of one query per employee.
+
+The helpers only take querysets, so models.py can use them too.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Khấu trừ 20% (thuế + bảo hiểm)
+DEDUCTION_RATE = Decimal('0.2')
+
+_TOTAL_FIELD = DecimalField(max_digits=10, decimal_places=2)
+_ZERO = Value(Decimal('0'), output_field=_TOTAL_FIELD)
+
+
+def _total(field, filter=None):
+    return Coalesce(Sum(field, filter=filter, output_field=_TOTAL_FIELD), _ZERO, output_field=_TOTAL_FIELD)
+
+
+def with_totals(employees, start_date, end_date):
+    """Annotate Employee rows with total_hours and total_work_units for ``start_date``..``end_date``"""
+    in_range = Q(attendancerecord__date__range=(start_date, end_date))
+    return employees.annotate(
+        total_hours=_total('attendancerecord__hours_worked', in_range),
+        total_work_units=_total('attendancerecord__work_units', in_range),
+    )
+
+
+def record_totals(records):
+    """{'total_hours', 'total_work_units'} of an AttendanceRecord queryset, in one query"""
+    return records.aggregate(
+        total_hours=_total('hours_worked'),
+        total_work_units=_total('work_units'),
+    )
+
+
+def pay_breakdown(total_work_units, daily_rate):
+    """(gross, deductions, net) pay for a number of work units at a daily rate"""
+    gross = Decimal(total_work_units or 0) * Decimal(daily_rate or 0)
+    deductions = gross * DEDUCTION_RATE
+    return gross, deductions, gross - deductions
@@ -0,0 +1,305 @@
+"""
+Headless ingestion for the cameras stored in CameraConfiguration.
+
+Each camera gets a ``CameraReader`` thread that decodes frames into a small
+``FrameBuffer``. When recognition falls behind, the buffer drops its oldest
+frames, so recognition always works on recent video. A ``CameraWorker``
+thread takes every ``sample_every``-th frame from the buffer and detects the
+faces in it, unless the ``FrameGate`` finds the frame unchanged or badly
+exposed. A ``FaceTracker`` follows those faces across frames, so each
+person is encoded and matched about once per visit, not once per frame.
+Blurred faces are not encoded.
+Each track records at most one attendance event.
+"""
+import collections
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+
+import cv2
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .attendance_service import record_face_attendance_many
+from .face_detection import DetectorConfig, FacePipeline, detection_scale
+from .face_gallery import gallery, recognition_scope
+from .face_tracking import FaceTracker
+from .frame_gate import GATE_EXPOSURE, GATE_STILL, FrameGate
+from .models import Employee
+
+
+@dataclass
+class CameraEvent:
+    camera: str
+    employee: Employee
+    action: str
+    distance: float
+    timestamp: object
+
+
+def open_capture(source):
+    """cv2.VideoCapture for a webcam index, an RTSP/HTTP URL or a video file path"""
+    source = str(source).strip()
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+class FrameBuffer:
+    """Bounded FIFO of (frame_number, frame) that drops the oldest frame when full"""
+
+    def __init__(self, capacity=4):
+        self._frames = collections.deque(maxlen=capacity)
+        self._ready = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, frame_number, frame):
+        with self._ready:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append((frame_number, frame))
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Oldest buffered frame; None on timeout, or once closed and drained"""
+        with self._ready:
+            self._ready.wait_for(lambda: self._frames or self.closed, timeout)
+            return self._frames.popleft() if self._frames else None
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class CameraReader(threading.Thread):
+    """
+    Decodes frames from one camera into a FrameBuffer.
+    Live streams are reopened after a failure. A video file is played once
+    at its own frame rate, so it behaves like a live camera.
+    """
+
+    def __init__(self, source, buffer, stop_event, reconnect_delay=2.0):
+        super().__init__(name=f'camera-reader-{source}', daemon=True)
+        self.source = str(source)
+        self.buffer = buffer
+        self.stop_event = stop_event
+        self.reconnect_delay = reconnect_delay
+        self.is_file = os.path.isfile(self.source)
+        self.frames_read = 0
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                capture = open_capture(self.source)
+                try:
+                    if capture.isOpened():
+                        self._read(capture)
+                    else:
+                        print(f'Camera {self.source}: cannot open source')
+                finally:
+                    capture.release()
+                if self.is_file:
+                    break
+                self.stop_event.wait(self.reconnect_delay)
+        finally:
+            self.buffer.close()
+
+    def _read(self, capture):
+        fps = capture.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_frame_at = time.monotonic()
+        while not self.stop_event.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                return
+            self.frames_read += 1
+            self.buffer.put(self.frames_read, frame)
+            if interval:
+                next_frame_at += interval
+                self.stop_event.wait(max(0.0, next_frame_at - time.monotonic()))
+
+
+class CameraWorker(threading.Thread):
+    """
+    Recognises faces on a sample of one camera's frames and records attendance.
+    Each face track records at most one event. An employee is also ignored
+    when they were last seen, in any track, less than ``cooldown`` seconds
+    ago. Someone who stays in front of the camera, or steps out of view
+    briefly, is therefore not checked out straight after checking in.
+    """
+
+    def __init__(self, camera, buffer, stop_event, sample_every=5, cooldown=300, on_event=None):
+        super().__init__(name=f'camera-worker-{camera.name}', daemon=True)
+        self.camera = camera
+        self.buffer = buffer
+        self.stop_event = stop_event
+        self.sample_every = max(1, sample_every)
+        self.cooldown = cooldown
+        self.on_event = on_event
+        self.frames_seen = 0
+        self.frames_sampled = 0
+        self.frames_gated = 0
+        self.frames_detected = 0
+        self.faces_blurry = 0
+        self.faces_encoded = 0
+        self.faces_matched = 0
+        self.events = 0
+        self.gate = FrameGate.from_settings()
+        self.pipeline = FacePipeline(DetectorConfig.from_camera(camera))
+        self.tracker = FaceTracker()
+        self._last_seen = {}
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                item = self.buffer.get(timeout=1.0)
+                if item is None:
+                    if self.buffer.closed:
+                        break
+                    continue
+                self.frames_seen += 1
+                if (self.frames_seen - 1) % self.sample_every:
+                    continue
+                self.frames_sampled += 1
+                try:
+                    for event in self.process(item[1]):
+                        self.events += 1
+                        if self.on_event:
+                            self.on_event(event)
+                except Exception as e:
+                    print(f'Error on camera {self.camera.name}: {e}')
+                    print(traceback.format_exc())
+                    close_old_connections()
+        finally:
+            close_old_connections()
+
+    def process(self, frame):
+        """Track and recognise the faces in one BGR frame; returns the CameraEvents recorded"""
+        verdict = self.gate.admit(frame)
+        # A still frame is only skipped once every face in view has been dealt with,
+        # so someone who walks in blurred and then stands still is still recognised
+        if verdict == GATE_EXPOSURE or (verdict == GATE_STILL and self.tracker.settled()):
+            self.frames_gated += 1
+            if verdict == GATE_STILL:
+                # Nothing moved: whoever was in view still is
+                for track in self.tracker.tracks:
+                    self._cooling_down(track.employee_id)
+            return []
+
+        scale = detection_scale(frame.shape, self.camera.detection_scale,
+                                getattr(settings, 'FACE_DETECTION_MAX_SIDE', None))
+        boxes = self.pipeline.detect(frame, scale)
+        if boxes:
+            self.frames_detected += 1
+        tracks = self.tracker.update(boxes, self.frames_sampled)
+
+        # Only new, unidentified or drifted tracks need an encoding and a gallery lookup;
+        # blurred faces wait for a sharper frame
+        pending = []
+        for track in tracks:
+            if not track.needs_encoding(self.frames_sampled):
+                continue
+            if self.gate.sharp(frame, track.box):
+                pending.append(track)
+            else:
+                self.faces_blurry += 1
+        if pending:
+            faces = self.pipeline.encode(frame, [track.box for track in pending])
+            self.faces_encoded += len(pending)
+            matches = gallery.match_many(
+                [face.encoding for face in faces], self.camera.threshold,
+                department_ids=recognition_scope(self.camera),
+            )
+            for track, (employee_id, distance) in zip(pending, matches):
+                track.identify(employee_id, distance, self.frames_sampled)
+                if employee_id is not None:
+                    self.faces_matched += 1
+
+        to_record = []
+        for track in tracks:
+            if track.employee_id is None:
+                continue
+            cooling_down = self._cooling_down(track.employee_id)
+            if track.recorded:
+                continue
+            track.recorded = True
+            if not cooling_down:
+                to_record.append(track)
+        if not to_record:
+            return []
+
+        # Everyone recognised in this frame is written in one batch
+        employees = Employee.objects.in_bulk([track.employee_id for track in to_record])
+        matches = [
+            (employees[track.employee_id], track.distance)
+            for track in to_record if track.employee_id in employees
+        ]
+        now = timezone.now()
+        results = record_face_attendance_many(matches, now, camera=self.camera if self.camera.pk else None)
+        return [
+            CameraEvent(self.camera.name, employee, action, distance, now)
+            for (employee, distance), (action, _, _) in zip(matches, results) if action
+        ]
+
+    def _cooling_down(self, employee_id):
+        now = time.monotonic()
+        last_seen = self._last_seen.get(employee_id)
+        self._last_seen[employee_id] = now
+        return last_seen is not None and now - last_seen < self.cooldown
+
+
+class CameraPipeline:
+    """Reader and worker threads for a set of cameras"""
+
+    def __init__(self, cameras, sample_every=None, buffer_size=None, cooldown=None, on_event=None):
+        self.stop_event = threading.Event()
+        self.readers = []
+        self.workers = []
+        for camera in cameras:
+            buffer = FrameBuffer(buffer_size or getattr(settings, 'FACE_CAMERA_BUFFER_SIZE', 4))
+            self.readers.append(CameraReader(camera.camera_source, buffer, self.stop_event))
+            self.workers.append(CameraWorker(
+                camera, buffer, self.stop_event,
+                sample_every=sample_every or getattr(settings, 'FACE_CAMERA_SAMPLE_EVERY', 5),
+                cooldown=getattr(settings, 'FACE_CAMERA_COOLDOWN', 300) if cooldown is None else cooldown,
+                on_event=on_event,
+            ))
+
+    def start(self):
+        for thread in self.workers + self.readers:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        """Wait for the workers; returns False if any is still running after ``timeout``"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(worker.is_alive() for worker in self.workers)
+
+    def stats(self):
+        """
+        Per-camera counters: frames read, dropped by the buffer, sampled,
+        gated (skipped before detection) and with a face detected, then faces
+        rejected as blurry, encoded and matched, and attendance events
+        """
+        return [
+            {
+                'camera': worker.camera.name,
+                'read': reader.frames_read,
+                'dropped': reader.buffer.dropped,
+                'sampled': worker.frames_sampled,
+                'gated': worker.frames_gated,
+                'detected': worker.frames_detected,
+                'blurry': worker.faces_blurry,
+                'encoded': worker.faces_encoded,
+                'matched': worker.faces_matched,
+                'events': worker.events,
+            }
+            for reader, worker in zip(self.readers, self.workers)
+        ]
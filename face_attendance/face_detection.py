@@ -0,0 +1,269 @@
+"""
+Frame preprocessing for recognition.
+
+HOG detection cost grows with pixel count, so faces are located on a
+downscaled copy of the frame and the boxes are mapped back to full
+resolution. Only a margin-padded crop around each box is converted to RGB and
+passed to the encoder, at full resolution.
+
+Each camera can pick the dlib model ('hog' or the slower, more accurate
+'cnn') and its upsample count. It can also add an OpenCV Haar/LBP cascade as
+a cheap first pass: dlib then only runs on the regions the cascade flagged,
+and not at all on frames where it found nothing.
+
+``FacePipeline`` holds the dlib detector, shape predictor and encoder. It
+converts, detects, finds landmarks and encodes each frame once, and writes
+colour conversions into reusable buffers. It returns a ``FrameFaces`` result
+that every caller shares. A pipeline keeps per-call state, so use one per
+thread: ``get_pipeline()`` returns the current thread's pipeline.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+
+import cv2
+import dlib
+import face_recognition.api as face_api
+import numpy as np
+from django.conf import settings
+
+from .face_tracking import box_iou
+
+# Longest side of the frame used for detection when no fixed scale is set
+DEFAULT_MAX_SIDE = 480
+# Padding around a detected box, as a fraction of its height, kept in the crop
+CROP_MARGIN = 0.25
+# Padding around a cascade candidate, as a fraction of its size, searched by dlib
+CASCADE_MARGIN = 0.5
+
+DETECTOR_MODELS = ('hog', 'cnn')
+CASCADES = ('haar', 'lbp')
+
+
+@dataclass(frozen=True)
+class DetectorConfig:
+    """Which detector locates faces; picklable so it can go to the recognition workers"""
+    model: str = 'hog'
+    upsample: int = 1
+    cascade: str = ''
+
+    @classmethod
+    def from_camera(cls, camera):
+        if camera is None:
+            return cls()
+        return cls(camera.detector_model, camera.detector_upsample, camera.detector_cascade)
+
+    @classmethod
+    def parse(cls, spec):
+        """Config from '[cascade+]model[:upsample]', e.g. 'hog', 'cnn:0', 'haar+hog:1'"""
+        cascade, _, detector = spec.rpartition('+')
+        model, _, upsample = detector.partition(':')
+        if model not in DETECTOR_MODELS or (cascade and cascade not in CASCADES):
+            raise ValueError(f'Unknown detector {spec!r}')
+        return cls(model, int(upsample) if upsample else 1, cascade)
+
+    def __str__(self):
+        return f'{self.cascade + "+" if self.cascade else ""}{self.model}:{self.upsample}'
+
+
+_cascades = {}
+_cascades_lock = threading.Lock()
+
+
+def cascade_path(name):
+    paths = getattr(settings, 'FACE_CASCADE_PATHS', {})
+    if paths.get(name):
+        return paths[name]
+    if name == 'haar' and getattr(cv2, 'data', None) is not None:
+        return os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+    return None
+
+
+def load_cascade(name):
+    """Cached cv2.CascadeClassifier for 'haar'/'lbp'; None when its XML file is not available"""
+    with _cascades_lock:
+        if name not in _cascades:
+            path = cascade_path(name)
+            classifier = cv2.CascadeClassifier(path) if path and os.path.exists(path) else None
+            if classifier is None or classifier.empty():
+                print(f'Face cascade {name!r} not found ({path}); using dlib only')
+                classifier = None
+            _cascades[name] = classifier
+        return _cascades[name]
+
+
+def detection_scale(frame_shape, scale=None, max_side=None):
+    """Scale factor for detection: a fixed ``scale``, else fit the longest side into ``max_side``"""
+    if scale:
+        return min(float(scale), 1.0)
+    longest = max(frame_shape[:2])
+    return min(1.0, (max_side or DEFAULT_MAX_SIDE) / longest)
+
+
+@dataclass
+class DetectedFace:
+    """One face: its box, the 5 landmark points the encoder used, and its encoding"""
+    location: tuple  # (top, right, bottom, left) in frame coordinates
+    landmarks: np.ndarray  # (5, 2) int32 (x, y) points in frame coordinates
+    encoding: np.ndarray  # 128 float32
+
+
+@dataclass
+class FrameFaces:
+    """Faces found in one frame, with the detection scale that was used"""
+    faces: list = field(default_factory=list)
+    scale: float = 1.0
+
+    def __len__(self):
+        return len(self.faces)
+
+    def __iter__(self):
+        return iter(self.faces)
+
+    def __getitem__(self, index):
+        return self.faces[index]
+
+    @property
+    def locations(self):
+        return [face.location for face in self.faces]
+
+    @property
+    def encodings(self):
+        return np.array([face.encoding for face in self.faces], dtype=np.float32).reshape(-1, 128)
+
+
+def _cascade_regions(classifier, gray):
+    """Padded (top, right, bottom, left) regions around the cascade's candidate faces"""
+    height, width = gray.shape
+    regions = []
+    for x, y, w, h in classifier.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(24, 24)):
+        pad_x, pad_y = int(w * CASCADE_MARGIN), int(h * CASCADE_MARGIN)
+        regions.append((max(0, y - pad_y), min(width, x + w + pad_x),
+                        min(height, y + h + pad_y), max(0, x - pad_x)))
+    return regions
+
+
+class FacePipeline:
+    """dlib detector, 5-point shape predictor and encoder with reusable conversion buffers"""
+
+    def __init__(self, detector=None):
+        self.detector = detector or DetectorConfig()
+        self.hog_detector = face_api.face_detector
+        self.cnn_detector = face_api.cnn_face_detector
+        # The 5-point predictor is the one face_recognition.face_encodings uses by
+        # default, so encodings stay comparable with the stored gallery
+        self.shape_predictor = face_api.pose_predictor_5_point
+        self.encoder = face_api.face_encoder
+        self._buffers = {}
+
+    def _rgb(self, bgr, slot):
+        """BGR -> RGB into the flat buffer kept for ``slot``, grown only when too small"""
+        buffer = self._buffers.get(slot)
+        if buffer is None or buffer.size < bgr.size:
+            buffer = self._buffers[slot] = np.empty(bgr.size, dtype=np.uint8)
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=buffer[:bgr.size].reshape(bgr.shape))
+
+    def _dlib_boxes(self, rgb, detector):
+        if detector.model == 'cnn':
+            rects = [detection.rect for detection in self.cnn_detector(rgb, detector.upsample)]
+        else:
+            rects = self.hog_detector(rgb, detector.upsample)
+        height, width = rgb.shape[:2]
+        return [
+            (max(rect.top(), 0), min(rect.right(), width), min(rect.bottom(), height), max(rect.left(), 0))
+            for rect in rects
+        ]
+
+    def _locate(self, small, detector):
+        classifier = load_cascade(detector.cascade) if detector.cascade else None
+        if classifier is None:
+            return self._dlib_boxes(self._rgb(small, 'detect'), detector)
+
+        # Escalate to dlib only inside the regions the cascade flagged
+        gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        boxes = []
+        for top, right, bottom, left in _cascade_regions(classifier, gray):
+            rgb = self._rgb(small[top:bottom, left:right], 'detect')
+            for box in self._dlib_boxes(rgb, detector):
+                box = (box[0] + top, box[1] + left, box[2] + top, box[3] + left)
+                # Overlapping candidate regions can report the same face twice
+                if all(box_iou(box, other) < 0.5 for other in boxes):
+                    boxes.append(box)
+        return boxes
+
+    def detect(self, frame, scale=1.0, detector=None):
+        """Face boxes (top, right, bottom, left) in full-resolution BGR ``frame`` coordinates"""
+        if scale < 1.0:
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        boxes = self._locate(small, detector or self.detector)
+        if scale >= 1.0:
+            return boxes
+
+        height, width = frame.shape[:2]
+        return [
+            (max(0, int(top / scale)), min(width, int(round(right / scale))),
+             min(height, int(round(bottom / scale))), max(0, int(left / scale)))
+            for top, right, bottom, left in boxes
+        ]
+
+    def encode(self, frame, locations):
+        """
+        Landmarks and full-resolution encoding of each located face. Each is
+        computed once on an RGB crop around the box, not on the whole frame.
+        """
+        height, width = frame.shape[:2]
+        faces = []
+        for location in locations:
+            top, right, bottom, left = location
+            pad = int((bottom - top) * CROP_MARGIN)
+            crop_top, crop_left = max(0, top - pad), max(0, left - pad)
+            crop = self._rgb(frame[crop_top:min(height, bottom + pad), crop_left:min(width, right + pad)], 'crop')
+
+            shape = self.shape_predictor(crop, dlib.rectangle(
+                left - crop_left, top - crop_top, right - crop_left, bottom - crop_top
+            ))
+            landmarks = np.array([(point.x + crop_left, point.y + crop_top) for point in shape.parts()],
+                                 dtype=np.int32)
+            encoding = np.asarray(self.encoder.compute_face_descriptor(crop, shape, 1), dtype=np.float32)
+            faces.append(DetectedFace(tuple(location), landmarks, encoding))
+        return faces
+
+    def process(self, frame, scale=None, max_side=None, pre_cropped=False, detector=None):
+        """
+        Locate and encode every face in a BGR frame.
+        With ``pre_cropped`` the client already sent just the face region, so
+        detection is skipped and the whole image is encoded as one face.
+        """
+        if pre_cropped:
+            height, width = frame.shape[:2]
+            return FrameFaces(self.encode(frame, [(0, width, height, 0)]), 1.0)
+        scale = detection_scale(frame.shape, scale, max_side)
+        return FrameFaces(self.encode(frame, self.detect(frame, scale, detector)), scale)
+
+
+_local = threading.local()
+
+
+def get_pipeline():
+    """The calling thread's FacePipeline"""
+    pipeline = getattr(_local, 'pipeline', None)
+    if pipeline is None:
+        pipeline = _local.pipeline = FacePipeline()
+    return pipeline
+
+
+def detect_faces(frame, scale=1.0, detector=None):
+    """Face boxes in full-resolution ``frame`` coordinates (see FacePipeline.detect)"""
+    return get_pipeline().detect(frame, scale, detector)
+
+
+def encode_faces(frame, locations):
+    """Float32 encoding of each located face (see FacePipeline.encode)"""
+    return [face.encoding for face in get_pipeline().encode(frame, locations)]
+
+
+def process_frame(frame, scale=None, max_side=None, pre_cropped=False, detector=None):
+    """FrameFaces for a BGR frame (see FacePipeline.process)"""
+    return get_pipeline().process(frame, scale, max_side, pre_cropped, detector)
@@ -0,0 +1,416 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .face_index import BruteForceIndex, CoarseQuantizer, IVFIndex, load_ivf
+from .models import ENCODING_DTYPE, FaceEncoding, FaceGalleryChange, Shift, decode_face_encoding
+
+ENCODING_SIZE = 128
+DEFAULT_TOLERANCE = 0.6
+
+MATCH_STRATEGIES = ('primary', 'centroid', 'min')
+DEFAULT_MATCH_K = 3
+
+DEFAULT_N_PROBE = 8
+# Below this many rows a brute-force scan is as fast as probing an IVF index
+IVF_MIN_ROWS = 1024
+
+# Change-log rows created this recently are re-read on every sync, so a row
+# whose id was allocated before a concurrent commit is not skipped.
+CHANGE_GRACE_SECONDS = 5
+# Default FACE_GALLERY_CHANGE_RETENTION: seconds change-log rows are kept
+DEFAULT_CHANGE_RETENTION = 24 * 3600
+
+
+class GalleryRows(namedtuple('GalleryRows', 'encoding_ids employee_ids department_ids encodings')):
+    """Column arrays for a set of gallery rows; ``department_ids`` uses -1 for none"""
+
+    @classmethod
+    def empty(cls):
+        ids = np.empty(0, dtype=np.int64)
+        return cls(ids, ids, ids, np.empty((0, ENCODING_SIZE), dtype=np.float32))
+
+    @classmethod
+    def concatenate(cls, parts):
+        return cls(*(np.concatenate(column) for column in zip(*parts)))
+
+    def select(self, mask):
+        return GalleryRows(*(column[mask] for column in self))
+
+
+def load_gallery_rows(employee_ids=None, strategy=None, k=None):
+    """
+    Load the encodings of active employees (optionally only ``employee_ids``)
+    and reduce them to the per-employee rows used for matching:
+
+    - ``primary``: the primary encoding (the newest one if none is flagged)
+    - ``centroid``: the mean of the newest ``k`` encodings
+    - ``min``: the newest ``k`` encodings, matched by their minimum distance
+    """
+    strategy = strategy or getattr(settings, 'FACE_MATCH_STRATEGY', 'min')
+    k = k or getattr(settings, 'FACE_MATCH_K', DEFAULT_MATCH_K)
+    if strategy not in MATCH_STRATEGIES:
+        raise ValueError(f"Unknown FACE_MATCH_STRATEGY: {strategy!r}")
+
+    queryset = FaceEncoding.objects.filter(employee__is_active=True)
+    if employee_ids is not None:
+        queryset = queryset.filter(employee_id__in=employee_ids)
+    rows = list(queryset.order_by('employee_id', '-date_created', '-id').values_list(
+        'id', 'employee_id', 'employee__department_id', 'is_primary', 'encoding_bytes', 'encoding_data'
+    ).iterator())
+    if not rows:
+        return GalleryRows.empty()
+
+    if all(row[4] is not None for row in rows):
+        # All rows binary: one join and a single view over the result
+        encodings = np.frombuffer(b''.join(row[4] for row in rows), dtype=ENCODING_DTYPE)
+    else:
+        encodings = np.concatenate([decode_face_encoding(row[4], row[5]) for row in rows])
+    gallery_rows = GalleryRows(
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.int64),
+        np.array([-1 if row[2] is None else row[2] for row in rows], dtype=np.int64),
+        encodings.reshape(-1, ENCODING_SIZE),
+    )
+    is_primary = np.array([row[3] for row in rows], dtype=bool)
+    return _aggregate(gallery_rows, is_primary, strategy, k)
+
+
+def _aggregate(rows, is_primary, strategy, k):
+    """Reduce rows sorted by (employee, newest first) according to ``strategy``"""
+    starts = np.flatnonzero(np.r_[True, rows.employee_ids[1:] != rows.employee_ids[:-1]])
+    group = np.cumsum(np.r_[False, rows.employee_ids[1:] != rows.employee_ids[:-1]])
+    rank = np.arange(len(group)) - starts[group]
+
+    if strategy == 'primary':
+        # First primary row of each employee, else the newest row
+        chosen = starts.copy()
+        primary_rows = np.flatnonzero(is_primary)
+        groups, first = np.unique(group[primary_rows], return_index=True)
+        chosen[groups] = primary_rows[first]
+        return rows.select(chosen)
+
+    recent = rows.select(rank < k)
+    if strategy == 'min':
+        return recent
+
+    # Centroid: the newest row of each employee carries the mean encoding
+    recent_starts = np.flatnonzero(
+        np.r_[True, recent.employee_ids[1:] != recent.employee_ids[:-1]]
+    )
+    counts = np.diff(np.r_[recent_starts, len(recent.employee_ids)])
+    encodings = np.asarray(recent.encodings, dtype=np.float32)
+    centroids = np.add.reduceat(encodings, recent_starts, axis=0) / counts[:, None]
+    return recent.select(recent_starts)._replace(encodings=centroids.astype(np.float32))
+
+
+class GallerySnapshot:
+    """Immutable view of the gallery used by a single match call.
+
+    ``encodings`` is a contiguous float32 (N x 128) matrix, ``employee_ids``,
+    ``department_ids`` and ``encoding_ids`` are aligned with its rows and
+    ``sq_norms`` holds the squared L2 norm of every row so distances reduce to
+    one matrix product. When a ``quantizer`` is given the rows are searched
+    through an IVF index, otherwise by brute force.
+    """
+
+    def __init__(self, rows, quantizer=None, n_probe=DEFAULT_N_PROBE, assignments=None):
+        self.rows = rows
+        self.encodings = np.ascontiguousarray(rows.encodings, dtype=np.float32)
+        self.employee_ids = rows.employee_ids
+        self.department_ids = rows.department_ids
+        self.encoding_ids = rows.encoding_ids
+        self.sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        if quantizer is None:
+            self.index = BruteForceIndex(self.encodings, self.sq_norms)
+        else:
+            self.index = IVFIndex(self.encodings, self.sq_norms, quantizer, n_probe, assignments)
+        self._partitions = {}
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    def partition(self, department_ids):
+        """Exact index over the rows of the given departments, built once per snapshot"""
+        key = frozenset(department_ids)
+        if key not in self._partitions:
+            positions = np.flatnonzero(np.isin(self.department_ids, list(key)))
+            self._partitions[key] = (
+                positions,
+                BruteForceIndex(self.encodings[positions], self.sq_norms[positions]),
+            )
+        return self._partitions[key]
+
+    def search(self, face_encoding, department_ids=None, k=1):
+        """(rows, distances) of the nearest rows, optionally within ``department_ids``"""
+        if department_ids is None:
+            return self.index.search(face_encoding, k)
+        positions, index = self.partition(department_ids)
+        rows, distances = index.search(face_encoding, k)
+        return positions[rows], distances
+
+    def search_many(self, face_encodings, department_ids=None):
+        """Nearest row and distance for each encoding (-1 when nothing to search)"""
+        if department_ids is None:
+            return self.index.search_many(face_encodings)
+        positions, index = self.partition(department_ids)
+        rows, distances = index.search_many(face_encodings)
+        found = rows >= 0
+        rows[found] = positions[rows[found]]
+        return rows, distances
+
+    def replace_employees(self, employee_ids, rows):
+        """Return a new snapshot with every row of ``employee_ids`` swapped for ``rows``"""
+        keep = ~np.isin(self.employee_ids, list(employee_ids))
+        merged = GalleryRows.concatenate([self.rows.select(keep), rows])
+        if not isinstance(self.index, IVFIndex):
+            return GallerySnapshot(merged)
+
+        # Keep the trained centroids and only route the new rows to their lists
+        quantizer = self.index.quantizer
+        assignments = np.concatenate([
+            self.index.assignments[keep],
+            quantizer.assign(np.asarray(rows.encodings, dtype=np.float32)),
+        ])
+        return GallerySnapshot(
+            merged, quantizer=quantizer, n_probe=self.index.n_probe, assignments=assignments,
+        )
+
+
+class FaceGallery:
+    """Process-wide cache of the face encodings of all active employees.
+
+    The gallery is kept current through ``FaceGalleryChange``: every write
+    that affects an employee's encodings appends a row there, and each
+    process replays rows newer than its ``version`` by reloading only the
+    affected employees. Rows are pruned after the retention period (see
+    prune_changes), so a process that has not synced for that long
+    reloads the whole gallery instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._dirty = False
+        self._last_sync = 0.0
+        self._recent_changes = {}
+        self.version = 0
+
+    @property
+    def sync_interval(self):
+        return getattr(settings, 'FACE_GALLERY_SYNC_INTERVAL', 0)
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            return self.reload()
+        if self._dirty or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        return self._snapshot
+
+    def reload(self):
+        """Rebuild the gallery matrix from the database"""
+        with self._lock:
+            # Read the version first: changes racing with the load are replayed
+            # by the next sync, and replaying is idempotent.
+            version = FaceGalleryChange.objects.aggregate(version=Max('id'))['version'] or 0
+            # Changes up to the version that are still inside the grace window are
+            # part of this load; remember them so the next sync does not re-apply them
+            now = timezone.now()
+            recent = FaceGalleryChange.objects.filter(
+                id__lte=version, created__gte=now - timedelta(seconds=CHANGE_GRACE_SECONDS)
+            ).values_list('id', flat=True)
+            self._recent_changes = dict.fromkeys(recent, now)
+            prune_changes(version)
+            self._snapshot = self._build_snapshot(load_gallery_rows())
+            self.version = version
+            self._dirty = False
+            self._last_sync = time.monotonic()
+            return self._snapshot
+
+    def _build_snapshot(self, rows):
+        backend = getattr(settings, 'FACE_INDEX_BACKEND', 'brute')
+        encodings = np.asarray(rows.encodings, dtype=np.float32)
+        if backend == 'brute' or len(encodings) < IVF_MIN_ROWS:
+            return GallerySnapshot(rows)
+        if backend != 'ivf':
+            raise ValueError(f"Unknown FACE_INDEX_BACKEND: {backend!r}")
+
+        n_probe = getattr(settings, 'FACE_INDEX_N_PROBE', DEFAULT_N_PROBE)
+        persisted = load_ivf(settings.FACE_INDEX_PATH)
+        if persisted is None:
+            quantizer = CoarseQuantizer.train(encodings, ivf_list_count(len(encodings)))
+            assignments = None
+        else:
+            # Reuse the persisted routing and only assign rows added since the build
+            quantizer, known = persisted
+            assignments = np.array([known.get(i, -1) for i in rows.encoding_ids.tolist()], dtype=np.int32)
+            missing = assignments < 0
+            if missing.any():
+                assignments[missing] = quantizer.assign(encodings[missing])
+        return GallerySnapshot(rows, quantizer=quantizer, n_probe=n_probe, assignments=assignments)
+
+    def sync(self):
+        """Apply change-log rows written by this or any other process since the last sync"""
+        with self._lock:
+            if self._snapshot is None:
+                return self.reload()
+            if time.monotonic() - self._last_sync >= change_retention() - CHANGE_GRACE_SECONDS:
+                # Change-log rows this process has not read yet may have been pruned
+                return self.reload()
+
+            now = timezone.now()
+            grace = now - timedelta(seconds=CHANGE_GRACE_SECONDS)
+            changes = FaceGalleryChange.objects.filter(
+                Q(id__gt=self.version) | Q(created__gte=grace)
+            ).values_list('id', 'employee_id')
+
+            employee_ids = set()
+            for change_id, employee_id in changes:
+                if change_id in self._recent_changes:
+                    continue
+                self._recent_changes[change_id] = now
+                self.version = max(self.version, change_id)
+                employee_ids.add(employee_id)
+
+            self._recent_changes = {
+                change_id: seen for change_id, seen in self._recent_changes.items()
+                if seen >= grace
+            }
+            if employee_ids:
+                self._snapshot = self._snapshot.replace_employees(
+                    employee_ids, load_gallery_rows(employee_ids)
+                )
+            self._dirty = False
+            self._last_sync = time.monotonic()
+            return self._snapshot
+
+    def mark_dirty(self):
+        """Force a sync before the next match in this process"""
+        self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+    def match(self, face_encoding, tolerance=DEFAULT_TOLERANCE, department_ids=None):
+        """
+        Find the nearest enrolled face.
+        Returns (employee_id, distance); employee_id is None when the nearest
+        face is farther than ``tolerance`` or the gallery is empty.
+        With ``department_ids`` only that partition is searched first, and
+        the whole gallery is the fallback when it has no confident match.
+        """
+        snapshot = self.snapshot
+        if department_ids:
+            employee_id, distance = _nearest(snapshot, face_encoding, tolerance, department_ids)
+            if employee_id is not None:
+                return employee_id, distance
+        return _nearest(snapshot, face_encoding, tolerance)
+
+    def match_many(self, face_encodings, tolerance=DEFAULT_TOLERANCE, department_ids=None):
+        """
+        Vectorised ``match`` for several faces against one snapshot.
+        Returns a list of (employee_id, distance) aligned with ``face_encodings``.
+        """
+        snapshot = self.snapshot
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        employee_ids = np.full(len(queries), -1, dtype=np.int64)
+        distances = np.full(len(queries), np.inf, dtype=np.float32)
+
+        pending = np.arange(len(queries))
+        for scope in ([department_ids] if department_ids else []) + [None]:
+            if not len(pending):
+                break
+            rows, found = snapshot.search_many(queries[pending], scope)
+            distances[pending] = np.minimum(distances[pending], found)
+            hit = (rows >= 0) & (found <= tolerance)
+            employee_ids[pending[hit]] = snapshot.employee_ids[rows[hit]]
+            distances[pending[hit]] = found[hit]
+            pending = pending[~hit]
+
+        return [
+            (int(employee_id) if employee_id >= 0 else None,
+             float(distance) if np.isfinite(distance) else None)
+            for employee_id, distance in zip(employee_ids, distances)
+        ]
+
+
+def _nearest(snapshot, face_encoding, tolerance, department_ids=None):
+    rows, distances = snapshot.search(face_encoding, department_ids)
+    if not len(rows):
+        return None, None
+
+    distance = float(distances[0])
+    if distance > tolerance:
+        return None, distance
+    return int(snapshot.employee_ids[rows[0]]), distance
+
+
+def recognition_scope(camera=None, now=None):
+    """
+    Department ids to search first for a recognition request: the camera's
+    department, otherwise departments with a shift running at ``now``.
+    Returns None (search everyone) when neither applies.
+    """
+    if camera is not None and camera.department_id:
+        return {camera.department_id}
+
+    current = timezone.localtime(now).time()
+    shifts = Shift.objects.filter(department__isnull=False).values_list(
+        'department_id', 'start_time', 'end_time'
+    )
+    departments = {
+        department_id for department_id, start, end in shifts
+        if _shift_running(start, end, current)
+    }
+    return departments or None
+
+
+def _shift_running(start, end, current):
+    if start <= end:
+        return start <= current <= end
+    # Overnight shift wrapping past midnight
+    return current >= start or current <= end
+
+
+def ivf_list_count(n_rows):
+    """Number of inverted lists: FACE_INDEX_N_LISTS, or about sqrt(N) by default"""
+    return getattr(settings, 'FACE_INDEX_N_LISTS', 0) or max(1, int(np.sqrt(n_rows)))
+
+
+def change_retention():
+    """Seconds FaceGalleryChange rows are kept (FACE_GALLERY_CHANGE_RETENTION)"""
+    return max(
+        getattr(settings, 'FACE_GALLERY_CHANGE_RETENTION', DEFAULT_CHANGE_RETENTION), 2 * CHANGE_GRACE_SECONDS
+    )
+
+
+def prune_changes(version=None):
+    """
+    Delete change-log rows older than the retention period. The newest row
+    is always kept: its id is the gallery version, and on SQLite ids of an
+    emptied table would start again from 1. Returns the rows deleted.
+    """
+    if version is None:
+        version = FaceGalleryChange.objects.aggregate(version=Max('id'))['version'] or 0
+    cutoff = timezone.now() - timedelta(seconds=change_retention())
+    deleted, _ = FaceGalleryChange.objects.filter(id__lt=version, created__lt=cutoff).delete()
+    return deleted
+
+
+def notify_changed(*employee_ids):
+    """Record that the encodings or active flag of these employees changed"""
+    FaceGalleryChange.objects.bulk_create(
+        [FaceGalleryChange(employee_id=employee_id) for employee_id in set(employee_ids)]
+    )
+    gallery.mark_dirty()
+
+
+gallery = FaceGallery()
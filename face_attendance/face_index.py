@@ -0,0 +1,170 @@
+"""
+Nearest-neighbour indexes over the face gallery matrix.
+
+``BruteForceIndex`` scans every row and is exact. ``IVFIndex`` partitions the
+rows into inverted lists around k-means centroids (a ``CoarseQuantizer``) and
+only scans the ``n_probe`` lists closest to the query, trading recall for
+latency. Both return (row indices, distances) sorted by distance.
+"""
+import os
+
+import numpy as np
+
+ASSIGN_CHUNK = 8192
+
+
+def _sq_distances(encodings, sq_norms, query):
+    return np.maximum(sq_norms - 2.0 * (encodings @ query) + query @ query, 0.0)
+
+
+def _no_match(count):
+    return np.full(count, -1, dtype=np.int64), np.full(count, np.inf, dtype=np.float32)
+
+
+def _top_k(sq_distances, k):
+    k = min(k, len(sq_distances))
+    if k < len(sq_distances):
+        top = np.argpartition(sq_distances, k - 1)[:k]
+    else:
+        top = np.arange(len(sq_distances))
+    return top[np.argsort(sq_distances[top])]
+
+
+class BruteForceIndex:
+    """Exact search over every row of the gallery"""
+    name = 'brute'
+
+    def __init__(self, encodings, sq_norms):
+        self.encodings = encodings
+        self.sq_norms = sq_norms
+
+    def search(self, query, k=1):
+        query = np.asarray(query, dtype=np.float32)
+        sq = _sq_distances(self.encodings, self.sq_norms, query)
+        top = _top_k(sq, k)
+        return top, np.sqrt(sq[top])
+
+    def search_many(self, queries):
+        """Nearest row and distance for every query, in one matrix product (-1 when empty)"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        if not len(self.encodings) or not len(queries):
+            return _no_match(len(queries))
+        sq = (self.sq_norms[None, :] - 2.0 * (queries @ self.encodings.T)
+              + np.einsum('ij,ij->i', queries, queries)[:, None])
+        rows = np.argmin(sq, axis=1)
+        return rows, np.sqrt(np.maximum(sq[np.arange(len(rows)), rows], 0.0))
+
+
+class CoarseQuantizer:
+    """k-means centroids that route gallery rows and queries to inverted lists"""
+
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+    def __len__(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, encodings, n_lists, iterations=10, sample_size=None, seed=0):
+        """Run Lloyd's k-means on (a sample of) the encodings"""
+        rng = np.random.default_rng(seed)
+        encodings = np.asarray(encodings, dtype=np.float32)
+        n_lists = max(1, min(n_lists, len(encodings)))
+        sample_size = sample_size or n_lists * 64
+        if len(encodings) > sample_size:
+            encodings = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+
+        quantizer = cls(encodings[rng.choice(len(encodings), n_lists, replace=False)])
+        for _ in range(iterations):
+            assignments = quantizer.assign(encodings)
+            sums = np.zeros_like(quantizer.centroids)
+            np.add.at(sums, assignments, encodings)
+            counts = np.bincount(assignments, minlength=n_lists)
+            centroids = quantizer.centroids.copy()
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            quantizer = cls(centroids)
+        return quantizer
+
+    def assign(self, encodings):
+        """Index of the nearest centroid for every row"""
+        assignments = np.empty(len(encodings), dtype=np.int32)
+        for start in range(0, len(encodings), ASSIGN_CHUNK):
+            chunk = encodings[start:start + ASSIGN_CHUNK]
+            sq = self.sq_norms[None, :] - 2.0 * (chunk @ self.centroids.T)
+            assignments[start:start + ASSIGN_CHUNK] = np.argmin(sq, axis=1)
+        return assignments
+
+    def nearest_lists(self, query, n_probe):
+        sq = self.sq_norms - 2.0 * (self.centroids @ query)
+        if n_probe >= len(sq):
+            return np.arange(len(sq))
+        return np.argpartition(sq, n_probe - 1)[:n_probe]
+
+
+class IVFIndex:
+    """Inverted-file index: exact distances, but only within the probed lists"""
+    name = 'ivf'
+
+    def __init__(self, encodings, sq_norms, quantizer, n_probe=8, assignments=None):
+        if assignments is None:
+            assignments = quantizer.assign(encodings)
+        self.quantizer = quantizer
+        self.n_probe = n_probe
+        self.assignments = assignments
+
+        # Store rows grouped by list so each probed list is one contiguous slice
+        self.order = np.argsort(assignments, kind='stable')
+        self.encodings = np.ascontiguousarray(encodings[self.order])
+        self.sq_norms = sq_norms[self.order]
+        self.offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assignments, minlength=len(quantizer))))
+        )
+
+    def search(self, query, k=1):
+        query = np.asarray(query, dtype=np.float32)
+        slices = [
+            slice(self.offsets[i], self.offsets[i + 1])
+            for i in self.quantizer.nearest_lists(query, self.n_probe)
+        ]
+        positions = np.concatenate([np.arange(s.start, s.stop) for s in slices]) if slices else []
+        if not len(positions):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        sq = np.concatenate([
+            _sq_distances(self.encodings[s], self.sq_norms[s], query) for s in slices
+        ])
+        top = _top_k(sq, k)
+        return self.order[positions[top]], np.sqrt(sq[top])
+
+    def search_many(self, queries):
+        """Nearest row and distance for every query (-1 when no probed list has rows)"""
+        rows, distances = _no_match(len(queries))
+        for i, query in enumerate(queries):
+            found, found_distances = self.search(query, k=1)
+            if len(found):
+                rows[i], distances[i] = found[0], found_distances[0]
+        return rows, distances
+
+
+def save_ivf(path, quantizer, encoding_ids, assignments):
+    """Persist the trained centroids and the list assignment of each encoding id"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(tmp_path, centroids=quantizer.centroids,
+             encoding_ids=np.asarray(encoding_ids, dtype=np.int64),
+             assignments=np.asarray(assignments, dtype=np.int32))
+    os.replace(tmp_path, path)
+
+
+def load_ivf(path):
+    """Load what ``save_ivf`` wrote; returns (quantizer, {encoding_id: list}) or None"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        quantizer = CoarseQuantizer(data['centroids'])
+        known = dict(zip(data['encoding_ids'].tolist(), data['assignments'].tolist()))
+    return quantizer, known
@@ -0,0 +1,103 @@
+"""
+IoU tracker for face boxes across the sampled frames of one camera.
+
+Detection still runs on every sampled frame. A face is only encoded and
+matched when its track is new, is still unidentified after ``retry_every``
+frames, or has moved so far from the box it was encoded at (IoU below
+``drift_iou``) that the old match may no longer hold.
+"""
+import itertools
+
+# Minimum overlap for a detection to continue an existing track
+TRACK_IOU = 0.3
+# Sampled frames a track survives without a matching detection
+TRACK_MAX_MISSES = 3
+# Sampled frames between encoding attempts for an unidentified track
+TRACK_RETRY_EVERY = 5
+# Re-encode an identified track once its box overlaps the encoded box less than this
+TRACK_DRIFT_IOU = 0.5
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area = lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    union = area(a) + area(b) - inter
+    return inter / union if union else 0.0
+
+
+class Track:
+    """One face followed across frames, with the identity it was matched to"""
+
+    def __init__(self, track_id, box, frame_index):
+        self.id = track_id
+        self.box = box
+        self.last_frame = frame_index
+        self.misses = 0
+        self.employee_id = None
+        self.distance = None
+        self.encoded_box = None
+        self.encoded_frame = None
+        # Set once the track has produced (or deliberately skipped) its attendance event
+        self.recorded = False
+
+    def needs_encoding(self, frame_index, retry_every=TRACK_RETRY_EVERY, drift_iou=TRACK_DRIFT_IOU):
+        if self.encoded_box is None:
+            return True
+        if self.employee_id is None:
+            return frame_index - self.encoded_frame >= retry_every
+        return box_iou(self.box, self.encoded_box) < drift_iou
+
+    def identify(self, employee_id, distance, frame_index):
+        if employee_id != self.employee_id:
+            self.recorded = False
+        self.employee_id = employee_id
+        self.distance = distance
+        self.encoded_box = self.box
+        self.encoded_frame = frame_index
+
+
+class FaceTracker:
+    """Greedy IoU association of each frame's face boxes with the live tracks"""
+
+    def __init__(self, iou_threshold=TRACK_IOU, max_misses=TRACK_MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def settled(self):
+        """True when every live track is identified and has had its attendance event"""
+        return all(track.employee_id is not None and track.recorded for track in self.tracks)
+
+    def update(self, boxes, frame_index):
+        """Assign every box to a track (new or existing); returns the tracks aligned with ``boxes``"""
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b)
+             for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True,
+        )
+        assigned = [None] * len(boxes)
+        used = set()
+        for iou, t, b in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in used or assigned[b] is not None:
+                continue
+            used.add(t)
+            track = self.tracks[t]
+            track.box, track.last_frame, track.misses = boxes[b], frame_index, 0
+            assigned[b] = track
+
+        for t, track in enumerate(self.tracks):
+            if t not in used:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                assigned[b] = Track(next(self._ids), box, frame_index)
+                self.tracks.append(assigned[b])
+        return assigned
@@ -1,13 +1,15 @@
-import face_recognition
 import cv2
-import numpy as np
 import json
-from .models import Employee, FaceEncoding, AttendanceRecord
+from .models import Employee, FaceEncoding
+from .attendance_service import record_face_attendance
+from .face_detection import detection_scale, get_pipeline
+from .face_gallery import DEFAULT_TOLERANCE, gallery, recognition_scope
 from django.utils import timezone
 
 def capture_face_with_button():
     """Capture face using either keyboard press or button click"""
     video_capture = cv2.VideoCapture(0)
+    pipeline = get_pipeline()
     captured_frame = None
     face_encoding = None
     
@@ -18,11 +20,8 @@ def capture_face_with_button():
         if not ret:
             break
             
-        # Convert BGR to RGB for processing
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Find faces
-        face_locations = face_recognition.face_locations(rgb_frame)
+        # Find faces on a downscaled copy; the boxes are reused at capture
+        face_locations = pipeline.detect(frame, detection_scale(frame.shape))
         
         # Draw rectangle around faces
         display_frame = frame.copy()
@@ -44,11 +43,11 @@ def capture_face_with_button():
         # If space is pressed and there's a face, capture it
         if key == 32:  # Space key
             if len(face_locations) > 0:
-                # Get face encodings
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                if len(face_encodings) > 0:
+                # Encode the face found in this preview frame, without detecting again
+                faces = pipeline.encode(frame, face_locations[:1])
+                if len(faces) > 0:
                     captured_frame = frame.copy()
-                    face_encoding = face_encodings[0]
+                    face_encoding = faces[0].encoding
                     print("Face captured successfully!")
                     break
                 else:
@@ -115,7 +114,7 @@ def register_employee_face(employee_id):
         print(traceback.format_exc())
         return False, str(e)
 
-def recognize_face_for_attendance():
+def recognize_face_for_attendance(camera=None):
     """Recognize face and mark attendance"""
     print("Please look at the camera and press SPACE to capture your face for attendance")
     face_encoding, _ = capture_face_with_button()
@@ -123,44 +122,23 @@ def recognize_face_for_attendance():
     if face_encoding is None:
         return False, "No face captured or capture cancelled"
         
-    # Get all active employees with face encodings
-    all_face_encodings = FaceEncoding.objects.filter(employee__is_active=True)
+    # Match against the in-memory gallery, searching the camera's department first
+    tolerance = camera.threshold if camera else DEFAULT_TOLERANCE
+    employee_id, distance = gallery.match(
+        face_encoding, tolerance, department_ids=recognition_scope(camera)
+    )
+
+    if employee_id is not None:
+        employee = Employee.objects.get(pk=employee_id)
     
-    for db_encoding in all_face_encodings:
-        # Get the stored encoding
-        stored_encoding = np.array(db_encoding.get_encoding())
-        
-        # Compare faces
-        matches = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)
+        # Same check-in/check-out upsert as the kiosk views
+        action, _, _ = record_face_attendance(employee, timezone.now())
+        if action == 'check_in':
+            return True, f"Check-in recorded for {employee.first_name} {employee.last_name}"
+        if action == 'check_out':
+            return True, f"Check-out recorded for {employee.first_name} {employee.last_name}"
+        return False, f"{employee.first_name} {employee.last_name} already checked out today"
         
-        if matches[0]:
-            employee = db_encoding.employee
-            today = timezone.now().date()
-            now = timezone.now()
-            
-            # Check if attendance already exists for today
-            attendance, created = AttendanceRecord.objects.get_or_create(
-                employee=employee,
-                date=today,
-                defaults={
-                    'check_in_time': now,
-                    'status': 'present',
-                    'verification_method': 'face'
-                }
-            )
-            
-            if not created:
-                # If already checked in, mark checkout time
-                if attendance.check_out_time is None:
-                    attendance.check_out_time = now
-                    attendance.calculate_hours()
-                    attendance.save()
-                    return True, f"Check-out recorded for {employee.first_name} {employee.last_name}"
-                else:
-                    return False, f"{employee.first_name} {employee.last_name} already checked out today"
-            else:
-                return True, f"Check-in recorded for {employee.first_name} {employee.last_name}"
-                
     return False, "No matching face found"
 
 # Optional: Add a GUI button for capturing
@@ -170,20 +148,19 @@ def capture_with_gui_button():
     from PIL import Image, ImageTk
     
     def update_frame():
+        nonlocal preview_frame, preview_locations
         ret, frame = video_capture.read()
         if ret:
-            # Convert to RGB for display
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Find faces
-            face_locations = face_recognition.face_locations(rgb_frame)
+            # Find faces; the capture button reuses this frame and its boxes
+            face_locations = pipeline.detect(frame, detection_scale(frame.shape))
+            preview_frame, preview_locations = frame.copy(), face_locations
             
             # Draw rectangles around faces
             for (top, right, bottom, left) in face_locations:
                 cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
                 
             # Convert to ImageTk format
-            img = Image.fromarray(rgb_frame)
+            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             imgtk = ImageTk.PhotoImage(image=img)
             panel.imgtk = imgtk
             panel.config(image=imgtk)
@@ -194,16 +171,13 @@ def capture_with_gui_button():
     
     def on_capture():
         nonlocal captured_encoding, captured_image
-        ret, frame = video_capture.read()
-        if ret:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame)
-            
+        frame, face_locations = preview_frame, preview_locations
+        if frame is not None:
             if len(face_locations) > 0:
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                if len(face_encodings) > 0:
-                    captured_encoding = face_encodings[0]
-                    captured_image = frame.copy()
+                faces = pipeline.encode(frame, face_locations[:1])
+                if len(faces) > 0:
+                    captured_encoding = faces[0].encoding
+                    captured_image = frame
                     status_label.config(text="Face captured successfully!")
                     root.after(1000, root.quit)
                 else:
@@ -220,6 +194,9 @@ def capture_with_gui_button():
     captured_encoding = None
     captured_image = None
     cancelled = False
+    pipeline = get_pipeline()
+    preview_frame = None
+    preview_locations = []
     
     # Initialize camera
     video_capture = cv2.VideoCapture(0)
@@ -0,0 +1,77 @@
+"""
+Cheap checks that run before the dlib stages of the camera pipeline.
+
+``FrameGate.admit`` compares a small grayscale copy of each frame with the
+previous one. A frame that barely changed, or is too dark or too bright,
+skips face detection. ``FrameGate.sharp`` scores a detected face by the
+variance of its Laplacian, so blurred captures are not encoded.
+"""
+import cv2
+import numpy as np
+from django.conf import settings
+
+# Width of the grayscale thumbnail used for the motion and exposure checks
+THUMBNAIL_WIDTH = 160
+# Per-pixel intensity change that counts as motion
+PIXEL_DELTA = 25
+# Side of the square a face crop is resized to before its sharpness is measured
+SHARPNESS_SIZE = 96
+
+GATE_PASSED = 'passed'
+GATE_STILL = 'still'
+GATE_EXPOSURE = 'exposure'
+
+
+class FrameGate:
+    """Motion, exposure and sharpness checks for one camera's frames"""
+
+    def __init__(self, motion_threshold=0.002, min_brightness=40, max_brightness=220, min_sharpness=20.0):
+        self.motion_threshold = motion_threshold
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self._previous = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            motion_threshold=getattr(settings, 'FACE_GATE_MOTION_THRESHOLD', 0.002),
+            min_brightness=getattr(settings, 'FACE_GATE_MIN_BRIGHTNESS', 40),
+            max_brightness=getattr(settings, 'FACE_GATE_MAX_BRIGHTNESS', 220),
+            min_sharpness=getattr(settings, 'FACE_GATE_MIN_SHARPNESS', 20.0),
+        )
+
+    def admit(self, frame):
+        """
+        GATE_PASSED when the frame should go to face detection, otherwise the
+        reason it was skipped: GATE_STILL (no motion since the previous frame)
+        or GATE_EXPOSURE (mean brightness outside the configured range).
+        """
+        height, width = frame.shape[:2]
+        thumbnail = cv2.resize(
+            frame, (THUMBNAIL_WIDTH, max(1, height * THUMBNAIL_WIDTH // width)),
+            interpolation=cv2.INTER_AREA,
+        )
+        gray = cv2.GaussianBlur(cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, gray
+
+        brightness = gray.mean()
+        if not self.min_brightness <= brightness <= self.max_brightness:
+            return GATE_EXPOSURE
+        if previous is not None and self.motion_threshold:
+            changed = np.count_nonzero(cv2.absdiff(gray, previous) > PIXEL_DELTA)
+            if changed < self.motion_threshold * gray.size:
+                return GATE_STILL
+        return GATE_PASSED
+
+    def sharpness(self, frame, location):
+        """Variance of the Laplacian over the face box, at a fixed crop size"""
+        top, right, bottom, left = location
+        crop = frame[top:bottom, left:right]
+        if not crop.size:
+            return 0.0
+        gray = cv2.cvtColor(cv2.resize(crop, (SHARPNESS_SIZE, SHARPNESS_SIZE)), cv2.COLOR_BGR2GRAY)
+        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    def sharp(self, frame, location):
+        return self.sharpness(frame, location) >= self.min_sharpness
@@ -0,0 +1,75 @@
+# management/commands/benchmark_detection_scale.py
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from face_attendance.face_detection import detect_faces, encode_faces
+from face_attendance.face_tracking import box_iou
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.JPG', '*.JPEG', '*.PNG')
+
+
+class Command(BaseCommand):
+    help = 'Report face detection accuracy and latency for several detection scale factors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', default=os.path.join(settings.MEDIA_ROOT, 'employee_profiles'),
+                            help='Directory of sample frames (e.g. captured from one camera)')
+        parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.35, 0.25])
+
+    def handle(self, *args, **options):
+        paths = sorted(
+            path for pattern in IMAGE_PATTERNS
+            for path in glob.glob(os.path.join(options['images'], pattern))
+        )
+        frames = [frame for frame in (cv2.imread(path) for path in paths) if frame is not None]
+        if not frames:
+            self.stdout.write(self.style.ERROR(f'No readable images in {options["images"]}'))
+            return
+        self.stdout.write(f'{len(frames)} frames from {options["images"]}')
+
+        # Full-resolution detection and encoding is the reference
+        reference = []
+        for frame in frames:
+            boxes = detect_faces(frame, 1.0)
+            reference.append((boxes, encode_faces(frame, boxes)))
+        reference_faces = sum(len(boxes) for boxes, _ in reference)
+
+        self.stdout.write(
+            f'{"scale":>6} {"faces":>6} {"recall":>7} {"enc dist":>9} {"detect ms":>10} {"encode ms":>10}'
+        )
+        for scale in options['scales']:
+            found = matched = 0
+            distances = []
+            detect_ms = encode_ms = 0.0
+            for frame, (reference_boxes, reference_encodings) in zip(frames, reference):
+                started = time.perf_counter()
+                boxes = detect_faces(frame, scale)
+                detected = time.perf_counter()
+                encodings = encode_faces(frame, boxes)
+                detect_ms += (detected - started) * 1000
+                encode_ms += (time.perf_counter() - detected) * 1000
+                found += len(boxes)
+
+                for box, encoding in zip(boxes, encodings):
+                    overlaps = [box_iou(box, reference_box) for reference_box in reference_boxes]
+                    if overlaps and max(overlaps) >= 0.5:
+                        matched += 1
+                        reference_encoding = reference_encodings[int(np.argmax(overlaps))]
+                        distances.append(np.linalg.norm(encoding - reference_encoding))
+
+            recall = matched / reference_faces if reference_faces else 0.0
+            mean_distance = np.mean(distances) if distances else float('nan')
+            self.stdout.write(
+                f'{scale:>6.2f} {found:>6} {recall:>7.2f} {mean_distance:>9.4f} '
+                f'{detect_ms / len(frames):>10.1f} {encode_ms / len(frames):>10.1f}'
+            )
+        self.stdout.write(
+            'recall: share of full-resolution faces still found; enc dist: mean distance '
+            'to the full-resolution encoding of the same face (match tolerance is 0.6)'
+        )
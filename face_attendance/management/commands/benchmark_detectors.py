@@ -0,0 +1,73 @@
+# management/commands/benchmark_detectors.py
+import glob
+import os
+import time
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from face_attendance.face_detection import DetectorConfig, detect_faces, detection_scale
+from face_attendance.face_tracking import box_iou
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.JPG', '*.JPEG', '*.PNG')
+
+
+class Command(BaseCommand):
+    help = 'Report face detection rate and latency for several detector configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', default=os.path.join(settings.MEDIA_ROOT, 'employee_profiles'),
+                            help='Directory of sample frames (e.g. captured from one camera)')
+        parser.add_argument('--detectors', nargs='+',
+                            default=['hog:1', 'hog:0', 'haar+hog:1', 'haar+hog:0', 'lbp+hog:0', 'cnn:1'],
+                            help="Configurations as '[cascade+]model[:upsample]'")
+        parser.add_argument('--reference', default='hog:1',
+                            help='Configuration whose faces count as ground truth')
+        parser.add_argument('--scale', type=float,
+                            help='Fixed detection scale (default: fit FACE_DETECTION_MAX_SIDE)')
+
+    def handle(self, *args, **options):
+        try:
+            reference = DetectorConfig.parse(options['reference'])
+            detectors = [DetectorConfig.parse(spec) for spec in options['detectors']]
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        paths = sorted(
+            path for pattern in IMAGE_PATTERNS
+            for path in glob.glob(os.path.join(options['images'], pattern))
+        )
+        frames = [frame for frame in (cv2.imread(path) for path in paths) if frame is not None]
+        if not frames:
+            raise CommandError(f'No readable images in {options["images"]}')
+        max_side = getattr(settings, 'FACE_DETECTION_MAX_SIDE', None)
+        scales = [detection_scale(frame.shape, options['scale'], max_side) for frame in frames]
+        self.stdout.write(f'{len(frames)} frames from {options["images"]}, reference {reference}')
+
+        reference_boxes = [detect_faces(frame, scale, reference) for frame, scale in zip(frames, scales)]
+        reference_faces = sum(len(boxes) for boxes in reference_boxes)
+
+        self.stdout.write(f'{"detector":>12} {"faces":>6} {"rate":>6} {"extra":>6} {"ms/frame":>9}')
+        for detector in detectors:
+            found = matched = 0
+            elapsed = 0.0
+            for frame, scale, expected in zip(frames, scales, reference_boxes):
+                started = time.perf_counter()
+                boxes = detect_faces(frame, scale, detector)
+                elapsed += time.perf_counter() - started
+                found += len(boxes)
+                matched += sum(
+                    1 for box in expected
+                    if any(box_iou(box, other) >= 0.5 for other in boxes)
+                )
+
+            rate = matched / reference_faces if reference_faces else 0.0
+            self.stdout.write(
+                f'{str(detector):>12} {found:>6} {rate:>6.2f} {max(0, found - matched):>6} '
+                f'{elapsed * 1000 / len(frames):>9.1f}'
+            )
+        self.stdout.write(
+            'rate: share of reference faces found (IoU >= 0.5); extra: detections '
+            'without a reference face (false positives or faces the reference missed)'
+        )
@@ -0,0 +1,75 @@
+# management/commands/benchmark_face_index.py
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from face_attendance.face_index import BruteForceIndex, CoarseQuantizer, IVFIndex
+
+
+def synthetic_gallery(n_employees, per_employee, spread, rng):
+    """Clustered encodings: one random identity centre per employee plus noise per sample"""
+    centres = rng.normal(scale=0.09, size=(n_employees, 128)).astype(np.float32)
+    owners = np.repeat(np.arange(n_employees), per_employee)
+    encodings = centres[owners] + rng.normal(scale=spread, size=(len(owners), 128)).astype(np.float32)
+    return centres, owners, encodings
+
+
+class Command(BaseCommand):
+    help = 'Compare IVF recall and latency against exact search on a synthetic gallery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000)
+        parser.add_argument('--per-employee', type=int, default=3, help='Encodings per employee')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--n-lists', type=int, default=0, help='Default: sqrt(gallery size)')
+        parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+        parser.add_argument('--spread', type=float, default=0.02, help='Per-sample noise around each identity')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        centres, owners, encodings = synthetic_gallery(
+            options['employees'], options['per_employee'], options['spread'], rng
+        )
+        sq_norms = np.einsum('ij,ij->i', encodings, encodings)
+
+        # Queries are fresh captures of enrolled employees
+        query_owners = rng.integers(0, options['employees'], size=options['queries'])
+        queries = centres[query_owners] + rng.normal(
+            scale=options['spread'], size=(len(query_owners), 128)
+        ).astype(np.float32)
+
+        exact = BruteForceIndex(encodings, sq_norms)
+        exact_rows, exact_ms = self._run(exact, queries)
+        self.stdout.write(
+            f'Gallery: {len(encodings)} encodings, {options["queries"]} queries; '
+            f'brute force {exact_ms:.3f} ms/query'
+        )
+
+        n_lists = options['n_lists'] or max(1, int(np.sqrt(len(encodings))))
+        started = time.perf_counter()
+        quantizer = CoarseQuantizer.train(encodings, n_lists, seed=options['seed'])
+        assignments = quantizer.assign(encodings)
+        self.stdout.write(f'IVF: {n_lists} lists trained in {time.perf_counter() - started:.2f}s')
+
+        self.stdout.write(f'{"n_probe":>8} {"recall@1":>9} {"id acc":>7} {"ms/query":>9} {"speedup":>8}')
+        for n_probe in options['n_probe']:
+            index = IVFIndex(encodings, sq_norms, quantizer, n_probe, assignments)
+            rows, ms = self._run(index, queries)
+            recall = np.mean(rows == exact_rows)
+            found = rows >= 0
+            accuracy = np.mean(found & (owners[np.where(found, rows, 0)] == query_owners))
+            self.stdout.write(
+                f'{n_probe:>8} {recall:>9.3f} {accuracy:>7.3f} {ms:>9.3f} {exact_ms / ms:>7.1f}x'
+            )
+
+    def _run(self, index, queries):
+        rows = np.full(len(queries), -1, dtype=np.int64)
+        started = time.perf_counter()
+        for i, query in enumerate(queries):
+            found, _ = index.search(query, k=1)
+            if len(found):
+                rows[i] = found[0]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return rows, elapsed_ms / len(queries)
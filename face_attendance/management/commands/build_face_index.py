@@ -0,0 +1,43 @@
+# management/commands/build_face_index.py
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from face_attendance.face_gallery import ivf_list_count, load_gallery_rows
+from face_attendance.face_index import CoarseQuantizer, save_ivf
+
+
+class Command(BaseCommand):
+    help = 'Train the IVF face index on the current gallery and save it to FACE_INDEX_PATH'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n-lists', type=int, default=0, help='Number of inverted lists (default: FACE_INDEX_N_LISTS or sqrt(N))')
+        parser.add_argument('--iterations', type=int, default=10, help='k-means iterations')
+        parser.add_argument('--path', default=None, help='Output file (default: FACE_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.FACE_INDEX_PATH
+        started = time.perf_counter()
+
+        rows = load_gallery_rows()
+        if not len(rows.encoding_ids):
+            self.stdout.write(self.style.WARNING('No face encodings enrolled; nothing to index'))
+            return
+        encoding_ids = rows.encoding_ids
+        encodings = np.asarray(rows.encodings, dtype=np.float32)
+        loaded = time.perf_counter()
+
+        n_lists = options['n_lists'] or ivf_list_count(len(encodings))
+        quantizer = CoarseQuantizer.train(encodings, n_lists, iterations=options['iterations'])
+        assignments = quantizer.assign(encodings)
+        save_ivf(path, quantizer, encoding_ids, assignments)
+        built = time.perf_counter()
+
+        sizes = np.bincount(assignments, minlength=len(quantizer))
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(encodings)} encodings into {len(quantizer)} lists '
+            f'(largest {sizes.max()}, empty {(sizes == 0).sum()}) at {path}'
+        ))
+        self.stdout.write(f'Load {loaded - started:.2f}s, train + assign {built - loaded:.2f}s')
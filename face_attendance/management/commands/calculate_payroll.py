@@ -1,38 +1,59 @@
 # management/commands/calculate_payroll.py
+import time
+
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from face_attendance.models import Employee, PayPeriod, Payroll
-import datetime
+from face_attendance.models import PayPeriod
+from face_attendance.payroll_engine import plan_shards, run_payroll
 
 class Command(BaseCommand):
     help = 'Calculate payroll for a specific pay period'
 
     def add_arguments(self, parser):
         parser.add_argument('pay_period_id', type=int, help='Pay Period ID')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes running department shards in parallel')
+        parser.add_argument('--shards', type=int,
+                            help='Department groups to split the run into (default: --workers)')
+        parser.add_argument('--department', type=int, nargs='+', metavar='ID',
+                            help='Only these departments (default: all)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Payroll rows per INSERT')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Compute and report the payroll without writing it')
 
     def handle(self, *args, **options):
         try:
             pay_period_id = options['pay_period_id']
             pay_period = PayPeriod.objects.get(id=pay_period_id)
-            
-            # Get all active employees
-            employees = Employee.objects.filter(is_active=True)
-            
-            for employee in employees:
-                # Check if payroll already exists
-                payroll, created = Payroll.objects.get_or_create(
-                    employee=employee,
-                    pay_period=pay_period,
-                    defaults={'status': 'pending'}
+
+            started = time.perf_counter()
+            shards = plan_shards(options['shards'] or options['workers'], options['department'])
+            results = run_payroll(
+                pay_period.id, shards,
+                workers=options['workers'],
+                dry_run=options['dry_run'],
+                chunk_size=options['chunk_size'],
+            )
+            elapsed = time.perf_counter() - started
+
+            for index, result in enumerate(results, 1):
+                departments = ', '.join('none' if department is None else str(department)
+                                        for department in result.departments)
+                self.stdout.write(
+                    f'Shard {index} (departments {departments}): {result.employees} employees, '
+                    f'{result.total_work_units:.2f} work units, net pay {result.net_pay:.2f}; '
+                    f'query {result.query_seconds:.2f}s, compute {result.compute_seconds:.2f}s, '
+                    f'write {result.write_seconds:.2f}s'
                 )
-                
-                # Calculate pay
-                payroll.calculate_pay()
-                self.stdout.write(self.style.SUCCESS(f'Calculated payroll for {employee.first_name} {employee.last_name}'))
-                
-            self.stdout.write(self.style.SUCCESS(f'Successfully calculated payroll for pay period {pay_period}'))
-        
+
+            employees = sum(result.employees for result in results)
+            net_pay = sum(result.net_pay for result in results)
+            verb = 'Would calculate' if options['dry_run'] else 'Successfully calculated'
+            self.stdout.write(self.style.SUCCESS(
+                f'{verb} payroll for {employees} employees in pay period {pay_period} '
+                f'(net pay {net_pay:.2f}) in {elapsed:.2f}s'
+            ))
+
         except PayPeriod.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'Pay period with ID {pay_period_id} does not exist'))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
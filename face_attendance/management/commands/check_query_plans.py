@@ -0,0 +1,186 @@
+# management/commands/check_query_plans.py
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from face_attendance.models import Employee, PayPeriod
+
+# Tables that grow with history; a full scan of one of them is a regression.
+# Employee is not listed: the reports list every active employee anyway
+WATCHED_TABLES = (
+    'face_attendance_attendancerecord',
+    'face_attendance_attendanceevent',
+    'face_attendance_faceencoding',
+    'face_attendance_payroll',
+    'face_attendance_monthlyattendancesummary',
+    'face_attendance_dailydepartmentsummary',
+)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper that keeps each statement with its parameters"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def _postgresql_scans(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        tables = set()
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('Plans', []))
+            if node['Node Type'] == 'Seq Scan':
+                tables.add(node['Relation Name'])
+        # Size of the whole table: the node's 'Plan Rows' is the estimate after filtering
+        for table in tables:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            rows = cursor.fetchone()[0]
+            if rows < 0:
+                # Never analysed
+                cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                rows = cursor.fetchone()[0]
+            yield table, int(rows)
+
+
+def _sqlite_scans(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        details = [row[-1] for row in cursor.fetchall()]
+        for detail in details:
+            # 'SCAN [TABLE] name' reads the whole table. 'SCAN name USING [COVERING] INDEX'
+            # walks an index in order (stopping early under a LIMIT), like PostgreSQL's
+            # Index Scan, and 'SEARCH' is an index lookup. Aliased tables (U0, ...) are not resolved
+            words = detail.split()
+            if words[:1] != ['SCAN'] or len(words) < 2 or 'USING' in words:
+                continue
+            table = words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1]
+            if table in WATCHED_TABLES:
+                cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                yield table, cursor.fetchone()[0]
+
+
+def report_checks(date_from, date_to):
+    """
+    (name, url, query parameters, query budget, check plans) for each report
+    view. Budgets are the exact counts the tests pin, including the session
+    and user lookups (the attendance export needs no login, so it has none).
+    The full attendance export reads every record by design, so its plan is
+    not checked.
+    """
+    period = {'date_from': date_from, 'date_to': date_to}
+    export = {**period, 'download_report': 'true'}
+    checks = [
+        ('index', reverse('face_attendance:index'), {}, 6, True),
+        ('attendance list', reverse('face_attendance:emp_attendance_list'), {}, 3, True),
+        ('attendance export', reverse('face_attendance:emp_attendance_list'), {'download_report': 'true'}, 1, False),
+        ('work units', reverse('face_attendance:work_units_list'), period, 3, True),
+        ('work units export', reverse('face_attendance:work_units_list'), export, 3, True),
+        ('salary calculator', reverse('face_attendance:salary_calculator'), period, 3, True),
+        ('salary export', reverse('face_attendance:salary_calculator'), export, 3, True),
+    ]
+    employee = Employee.objects.filter(is_active=True).order_by('id').first()
+    if employee is not None:
+        checks.append(('employee salary', reverse('face_attendance:employee_salary', args=[employee.employee_id]),
+                       period, 5, True))
+    pay_period = PayPeriod.objects.order_by('-id').first()
+    if pay_period is not None:
+        checks.append(('payroll detail', reverse('face_attendance:payroll_detail', args=[pay_period.id]),
+                       {}, 4, True))
+    return checks
+
+
+def render_report(client, url, params):
+    """GET a report with ``client``; returns the response and the (sql, params) it ran"""
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        response = client.get(url, params)
+        # Streaming exports run their queries while the body is read
+        b''.join(response.streaming_content) if response.streaming else response.content
+    return response, recorder.queries
+
+
+def full_scans(queries, min_rows):
+    """(table, rows, sql) for each full scan of a watched table with at least ``min_rows`` rows"""
+    scans = {'postgresql': _postgresql_scans, 'sqlite': _sqlite_scans}.get(connection.vendor)
+    if scans is None:
+        return []
+    found = []
+    for sql, params in queries:
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        for table, rows in scans(sql, params):
+            if table in WATCHED_TABLES and rows >= min_rows:
+                found.append((table, rows, sql))
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Render each report view, check its query count against a budget and '
+            'EXPLAIN its queries to catch full scans of the large tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to render the pages as (default: first superuser)')
+        parser.add_argument('--from', dest='date_from', help='Report start date (default: first day of this month)')
+        parser.add_argument('--to', dest='date_to', help='Report end date (default: today)')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Only report full scans of tables with at least this many (estimated) rows')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query checked')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError('No user to render the reports as; pass --user')
+
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.stdout.write(self.style.WARNING(f'No plan check for {connection.vendor}; checking query counts only'))
+
+        today = timezone.now().date()
+        date_from = options['date_from'] or today.replace(day=1).isoformat()
+        date_to = options['date_to'] or today.isoformat()
+        client = Client()
+        client.force_login(user)
+
+        failures = 0
+        for name, url, params, budget, check_plans in report_checks(date_from, date_to):
+            response, queries = render_report(client, url, params)
+
+            problems = []
+            if response.status_code != 200:
+                problems.append(f'status {response.status_code}')
+            if len(queries) > budget:
+                problems.append(f'{len(queries)} queries, budget {budget}')
+            if options['verbose_plans']:
+                for sql, _ in queries:
+                    self.stdout.write(f'    {sql[:200]}')
+            if check_plans:
+                for table, rows, sql in full_scans(queries, options['min_rows']):
+                    problems.append(f'full scan of {table} (~{rows} rows) in: {sql[:120]}')
+
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'{name}: FAIL'))
+                for problem in problems:
+                    self.stdout.write(f'  - {problem}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: {len(queries)} queries (budget {budget})'))
+
+        if failures:
+            raise CommandError(f'{failures} report views failed the query checks')
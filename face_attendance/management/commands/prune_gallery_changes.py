@@ -0,0 +1,14 @@
+# management/commands/prune_gallery_changes.py
+from django.core.management.base import BaseCommand
+
+from face_attendance.face_gallery import change_retention, prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete face gallery change-log rows older than FACE_GALLERY_CHANGE_RETENTION'
+
+    def handle(self, *args, **options):
+        deleted = prune_changes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} gallery changes older than {change_retention()} seconds'
+        ))
@@ -0,0 +1,35 @@
+# management/commands/rollup_attendance.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from face_attendance.attendance_service import ROLLUP_CHECKPOINT, rollup_events
+
+
+class Command(BaseCommand):
+    help = 'Fold new attendance punches (AttendanceEvent) into AttendanceRecord'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Punches per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new punches')
+        parser.add_argument('--interval', type=float, default=10.0,
+                            help='Seconds between polls with --loop')
+        parser.add_argument('--checkpoint', default=ROLLUP_CHECKPOINT,
+                            help='Checkpoint name (separate roll-up jobs keep separate positions)')
+
+    def handle(self, *args, **options):
+        while True:
+            total_events = total_days = 0
+            while True:
+                events, days = rollup_events(options['batch_size'], options['checkpoint'])
+                if not events:
+                    break
+                total_events += events
+                total_days += days
+            if total_events or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rolled up {total_events} punches into {total_days} attendance records'
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
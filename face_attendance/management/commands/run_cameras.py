@@ -0,0 +1,94 @@
+# management/commands/run_cameras.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from face_attendance.camera_pipeline import CameraPipeline
+from face_attendance.face_gallery import DEFAULT_TOLERANCE
+from face_attendance.models import CameraConfiguration
+from face_attendance.punch_buffer import get_buffer, write_behind
+
+
+class Command(BaseCommand):
+    help = 'Read the configured cameras and record attendance for recognised faces'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--camera', nargs='+', metavar='NAME',
+                            help='Camera configuration names (default: all)')
+        parser.add_argument('--source',
+                            help='Read this source (webcam index, stream URL or video file) '
+                                 'instead of the camera\'s own; needs at most one --camera')
+        parser.add_argument('--sample-every', type=int,
+                            help='Recognise every Nth frame (default FACE_CAMERA_SAMPLE_EVERY)')
+        parser.add_argument('--buffer-size', type=int,
+                            help='Frames buffered per camera (default FACE_CAMERA_BUFFER_SIZE)')
+        parser.add_argument('--cooldown', type=float,
+                            help='Seconds before the same employee is recorded again '
+                                 '(default FACE_CAMERA_COOLDOWN)')
+        parser.add_argument('--stats-every', type=float, default=0,
+                            help='Print per-camera frame counters every N seconds')
+
+    def handle(self, *args, **options):
+        cameras = CameraConfiguration.objects.select_related('department').order_by('name')
+        if options['camera']:
+            cameras = cameras.filter(name__in=options['camera'])
+        cameras = list(cameras)
+
+        if options['source']:
+            if len(cameras) > 1:
+                raise CommandError('--source replaces the source of a single camera; pass one --camera')
+            if cameras:
+                cameras[0].camera_source = options['source']
+            else:
+                cameras = [CameraConfiguration(name=options['source'], camera_source=options['source'],
+                                               threshold=DEFAULT_TOLERANCE)]
+        if not cameras:
+            raise CommandError('No camera configurations found')
+
+        pipeline = CameraPipeline(
+            cameras,
+            sample_every=options['sample_every'],
+            buffer_size=options['buffer_size'],
+            cooldown=options['cooldown'],
+            on_event=self.report_event,
+        )
+        for camera in cameras:
+            self.stdout.write(f'Reading camera {camera.name} ({camera.camera_source})')
+        pipeline.start()
+        try:
+            # Returns when every source has ended (video files); live cameras run until Ctrl+C
+            last_stats = time.monotonic()
+            while not pipeline.join(timeout=1.0):
+                if options['stats_every'] and time.monotonic() - last_stats >= options['stats_every']:
+                    self.report_stats(pipeline)
+                    last_stats = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping cameras...')
+            pipeline.stop()
+            pipeline.join(timeout=10.0)
+
+        self.report_stats(pipeline)
+
+    def report_stats(self, pipeline):
+        for stats in pipeline.stats():
+            self.stdout.write(
+                f'{stats["camera"]}: frames {stats["read"]} read, {stats["dropped"]} dropped, '
+                f'{stats["sampled"]} sampled, {stats["gated"]} gated, {stats["detected"]} with faces; '
+                f'faces {stats["blurry"]} blurry, {stats["encoded"]} encoded, {stats["matched"]} matched; '
+                f'{stats["events"]} attendance events'
+            )
+        if write_behind():
+            stats = get_buffer().stats()
+            self.stdout.write(
+                f'Punch buffer: {stats["depth"]} queued (oldest {stats["oldest_age"]}s), '
+                f'{stats["flushed"]} flushed in {stats["flushes"]} batches, {stats["failures"]} failures; '
+                f'last flush {stats["last_flush_ms"]} ms, max {stats["max_flush_ms"]} ms'
+            )
+
+    def report_event(self, event):
+        label = 'Check-in' if event.action == 'check_in' else 'Check-out'
+        self.stdout.write(self.style.SUCCESS(
+            f'[{timezone.localtime(event.timestamp):%H:%M:%S}] {event.camera}: {label} recorded for '
+            f'{event.employee.first_name} {event.employee.last_name} (distance {event.distance:.3f})'
+        ))
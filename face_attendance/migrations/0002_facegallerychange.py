@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 17:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceGalleryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_id', models.BigIntegerField()),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 17:09
+
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def json_to_binary(apps, schema_editor):
+    FaceEncoding = apps.get_model('face_attendance', 'FaceEncoding')
+    pending = FaceEncoding.objects.filter(encoding_bytes__isnull=True).exclude(encoding_data='')
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        for row in batch:
+            row.encoding_bytes = np.asarray(json.loads(row.encoding_data), dtype='<f4').tobytes()
+            row.encoding_data = ''
+        FaceEncoding.objects.bulk_update(batch, ['encoding_bytes', 'encoding_data'])
+        last_id = batch[-1].id
+
+
+def binary_to_json(apps, schema_editor):
+    FaceEncoding = apps.get_model('face_attendance', 'FaceEncoding')
+    pending = FaceEncoding.objects.filter(encoding_bytes__isnull=False)
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        for row in batch:
+            row.encoding_data = json.dumps(np.frombuffer(row.encoding_bytes, dtype='<f4').tolist())
+            row.encoding_bytes = None
+        FaceEncoding.objects.bulk_update(batch, ['encoding_bytes', 'encoding_data'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('face_attendance', '0002_facegallerychange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceencoding',
+            name='encoding_bytes',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='faceencoding',
+            name='encoding_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0003_faceencoding_binary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cameraconfiguration',
+            name='department',
+            field=models.ForeignKey(blank=True, help_text='Match employees of this department first', null=True, on_delete=django.db.models.deletion.SET_NULL, to='face_attendance.department'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0004_cameraconfiguration_department'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cameraconfiguration',
+            name='detection_scale',
+            field=models.FloatField(blank=True, help_text='Downscale factor for face detection, e.g. 0.5 (blank = fit FACE_DETECTION_MAX_SIDE)', null=True),
+        ),
+    ]
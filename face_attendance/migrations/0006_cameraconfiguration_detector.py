@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0005_cameraconfiguration_detection_scale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cameraconfiguration',
+            name='detector_cascade',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('haar', 'OpenCV Haar cascade'), ('lbp', 'OpenCV LBP cascade')], default='', help_text='Cheap first-pass detector; dlib only runs where it finds a candidate face', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='cameraconfiguration',
+            name='detector_model',
+            field=models.CharField(choices=[('hog', 'HOG (fast, CPU)'), ('cnn', 'CNN (accurate, slow without GPU)')], default='hog', help_text='dlib face detector', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='cameraconfiguration',
+            name='detector_upsample',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Times the frame is upsampled to find smaller faces (0 = fastest)'),
+        ),
+    ]
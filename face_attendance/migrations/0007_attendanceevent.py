@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 17:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0006_cameraconfiguration_detector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AttendanceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(help_text='When the face was recognised')),
+                ('distance', models.FloatField(blank=True, help_text='Face distance of the match', null=True)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('camera', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='face_attendance.cameraconfiguration')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_events', to='face_attendance.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['employee', 'timestamp'], name='face_attend_employe_825a91_idx')],
+            },
+        ),
+    ]
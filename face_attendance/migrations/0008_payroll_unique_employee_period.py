@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 17:38
+
+from django.db import migrations
+from django.db.models import Count
+
+
+# Which duplicate to keep: a paid row, then a processed one, then the newest
+STATUS_RANK = {'paid': 0, 'processed': 1}
+
+
+def remove_duplicate_payrolls(apps, schema_editor):
+    # One row per (employee, pay_period) before the constraint is added. Pending
+    # duplicates are re-calculations and can go; two paid/processed rows for the
+    # same period need a person to decide, so the migration stops and lists them
+    Payroll = apps.get_model('face_attendance', 'Payroll')
+    duplicates = (
+        Payroll.objects.values('employee_id', 'pay_period_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    to_delete, conflicts = [], []
+    for row in duplicates:
+        payrolls = sorted(
+            Payroll.objects.filter(employee_id=row['employee_id'], pay_period_id=row['pay_period_id'])
+            .values_list('id', 'status'),
+            key=lambda payroll: (STATUS_RANK.get(payroll[1], len(STATUS_RANK)), -payroll[0]),
+        )
+        settled = [payroll for payroll in payrolls if payroll[1] in STATUS_RANK]
+        if len(settled) > 1:
+            conflicts.append(
+                f"employee {row['employee_id']}, pay period {row['pay_period_id']}: "
+                + ', '.join(f'#{payroll_id} ({status})' for payroll_id, status in settled)
+            )
+            continue
+        to_delete.extend(payroll_id for payroll_id, _ in payrolls[1:])
+
+    if conflicts:
+        raise RuntimeError(
+            'Several paid/processed payrolls exist for the same employee and pay period. '
+            'Delete the wrong ones, then migrate again:\n  ' + '\n  '.join(conflicts)
+        )
+    Payroll.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0007_attendanceevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_payrolls, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='payroll',
+            unique_together={('employee', 'pay_period')},
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2 on 2026-10-18 17:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 1000
+
+
+def fill_summaries(apps, schema_editor):
+    # Same totals as attendance_summary.rebuild, for every existing record
+    AttendanceRecord = apps.get_model('face_attendance', 'AttendanceRecord')
+    MonthlyAttendanceSummary = apps.get_model('face_attendance', 'MonthlyAttendanceSummary')
+    DailyDepartmentSummary = apps.get_model('face_attendance', 'DailyDepartmentSummary')
+
+    def totals(present_field):
+        return {
+            'records': Count('id'),
+            present_field: Count('id', filter=Q(status__in=['present', 'late'])),
+            'total_hours': Sum('hours_worked'),
+            'total_work_units': Sum('work_units'),
+        }
+
+    MonthlyAttendanceSummary.objects.bulk_create([
+        MonthlyAttendanceSummary(**row)
+        for row in AttendanceRecord.objects.annotate(month=TruncMonth('date'))
+        .values('employee_id', 'month').annotate(**totals('days_present')).order_by()
+    ], batch_size=BATCH_SIZE)
+    DailyDepartmentSummary.objects.bulk_create([
+        DailyDepartmentSummary(department_key=row.pop('employee__department_id') or 0, **row)
+        for row in AttendanceRecord.objects.values('date', 'employee__department_id')
+        .annotate(**totals('present')).order_by()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0008_payroll_unique_employee_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDepartmentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('department_key', models.BigIntegerField(help_text='Department id, 0 for employees without a department')),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_work_units', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('date', 'department_key')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('days_present', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_work_units', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='face_attendance.employee')),
+            ],
+            options={
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
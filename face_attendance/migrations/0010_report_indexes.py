@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 17:42
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.conf import settings
+from django.db import migrations, models
+
+
+class PostgreSQLAddIndex(migrations.AddIndex):
+    """AddIndex that only touches PostgreSQL databases; gin_trgm_ops does not exist elsewhere"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class PostgreSQLTrigramExtension(TrigramExtension):
+    """TrigramExtension whose reverse also skips other databases (the forward already does)"""
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0009_attendance_summaries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # pg_trgm for the gin_trgm_ops indexes on the employee search columns
+        PostgreSQLTrigramExtension(),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['date', 'status'], name='attendance_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['department'], name='employee_active_dept_idx'),
+        ),
+        PostgreSQLAddIndex(
+            model_name='employee',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('first_name'), name='gin_trgm_ops'), name='employee_first_name_trgm'),
+        ),
+        PostgreSQLAddIndex(
+            model_name='employee',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('last_name'), name='gin_trgm_ops'), name='employee_last_name_trgm'),
+        ),
+        PostgreSQLAddIndex(
+            model_name='employee',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('employee_id'), name='gin_trgm_ops'), name='employee_code_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='faceencoding',
+            index=models.Index(fields=['employee', 'is_primary', '-date_created'], name='faceencoding_emp_primary_idx'),
+        ),
+    ]
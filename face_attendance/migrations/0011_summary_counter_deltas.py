@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_attendance', '0010_report_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailydepartmentsummary',
+            name='present',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dailydepartmentsummary',
+            name='records',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='monthlyattendancesummary',
+            name='days_present',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='monthlyattendancesummary',
+            name='records',
+            field=models.IntegerField(default=0),
+        ),
+    ]
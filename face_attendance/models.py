@@ -1,8 +1,25 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 from django.utils import timezone
 from django.contrib.auth.models import User
 import json
-from decimal import Decimal
+import numpy as np
+
+from .attendance_totals import pay_breakdown, record_totals
+
+ENCODING_DTYPE = np.dtype('<f4')
+
+def encode_face_encoding(encoding_array):
+    """Pack a face encoding into little-endian float32 bytes"""
+    return np.asarray(encoding_array, dtype=ENCODING_DTYPE).tobytes()
+
+def decode_face_encoding(encoding_bytes, encoding_data=''):
+    """Unpack a stored encoding, accepting legacy JSON rows not yet converted"""
+    if encoding_bytes is not None:
+        return np.frombuffer(encoding_bytes, dtype=ENCODING_DTYPE)
+    return np.array(json.loads(encoding_data), dtype=ENCODING_DTYPE)
 
 class Department(models.Model):
     name = models.CharField(max_length=100)
@@ -25,6 +42,16 @@ class Employee(models.Model):
     profile_image = models.ImageField(upload_to='employee_profiles/', null=True, blank=True)
     daily_rate = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Mức lương theo ngày công")
     
+    class Meta:
+        indexes = [
+            # Reports and the face gallery only look at active employees
+            models.Index(fields=['department'], condition=Q(is_active=True), name='employee_active_dept_idx'),
+            # Trigram indexes for the name/ID searches (icontains compiles to UPPER(col) LIKE UPPER(...))
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='employee_first_name_trgm'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='employee_last_name_trgm'),
+            GinIndex(OpClass(Upper('employee_id'), name='gin_trgm_ops'), name='employee_code_trgm'),
+        ]
+    
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.employee_id})"
         
@@ -34,7 +61,7 @@ class Employee(models.Model):
             employee=self,
             date__range=(start_date, end_date)
         )
-        return sum(record.work_units for record in records)
+        return record_totals(records)['total_work_units']
     
     def calculate_salary(self, start_date, end_date):
         """Tính lương dựa trên số công và mức lương ngày công"""
@@ -43,19 +70,39 @@ class Employee(models.Model):
 
 class FaceEncoding(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='face_encodings')
-    encoding_data = models.TextField()  # Will store JSON string of face encoding array
+    encoding_bytes = models.BinaryField(null=True, blank=True)  # 128 float32 values, see ENCODING_DTYPE
+    encoding_data = models.TextField(blank=True, default='')  # Legacy JSON encoding, read until rows are converted
     date_created = models.DateTimeField(auto_now_add=True)
     is_primary = models.BooleanField(default=True)
     
+    class Meta:
+        # Gallery loads read each employee's encodings newest first; registration clears is_primary per employee
+        indexes = [models.Index(fields=['employee', 'is_primary', '-date_created'], name='faceencoding_emp_primary_idx')]
+    
     def set_encoding(self, encoding_array):
-        self.encoding_data = json.dumps(encoding_array.tolist())
+        self.encoding_bytes = encode_face_encoding(encoding_array)
+        self.encoding_data = ''
     
     def get_encoding(self):
-        return json.loads(self.encoding_data)
+        return decode_face_encoding(self.encoding_bytes, self.encoding_data)
     
     def __str__(self):
         return f"Face encoding for {self.employee.first_name} {self.employee.last_name}"
 
+class FaceGalleryChange(models.Model):
+    """Append-only log of employees whose face gallery entries changed.
+
+    The auto-increment id doubles as a cross-process gallery version. Rows
+    are kept for FACE_GALLERY_CHANGE_RETENTION seconds (default one day) and
+    pruned on each full gallery reload or by ``prune_gallery_changes``;
+    the newest row is never pruned.
+    """
+    employee_id = models.BigIntegerField()  # Not a FK: rows outlive deleted employees
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Gallery change #{self.id} for employee {self.employee_id}"
+
 class Shift(models.Model):
     name = models.CharField(max_length=100)
     start_time = models.TimeField()
@@ -92,29 +139,99 @@ class AttendanceRecord(models.Model):
     work_units = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Đơn vị công (1 công = 8 giờ)")
     
     class Meta:
-        unique_together = ['employee', 'date']
+        unique_together = ['employee', 'date']  # Also serves employee + date range filters
+        indexes = [
+            # Per-day filters, the status filter on a day and ORDER BY -date
+            models.Index(fields=['date', 'status'], name='attendance_date_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.employee.first_name} {self.employee.last_name} - {self.date} - {self.status}"
     
-    def calculate_hours(self):
+    def calculate_hours(self, commit=True):
         if self.check_in_time and self.check_out_time:
             duration = self.check_out_time - self.check_in_time
             self.hours_worked = round(duration.total_seconds() / 3600, 2)
             # Tính công dựa trên số giờ làm việc (1 công = 8 giờ)
             self.work_units = round(self.hours_worked / 8, 2)
-            self.save()
+            if commit:
+                self.save()
 
-    @property
-    def calculate_duration(self):
-        if self.check_in_time and self.check_out_time:
-            duration = self.check_out_time - self.check_in_time
+    @staticmethod
+    def format_duration(check_in_time, check_out_time):
+        """'Xh Ym' between two times, or None when either is missing"""
+        if check_in_time and check_out_time:
+            duration = check_out_time - check_in_time
             total_minutes = duration.total_seconds() / 60
             hours = int(total_minutes // 60)
             minutes = int(total_minutes % 60)
             return f"{hours}h {minutes}m"
         return None  # or return "Incomplete"
 
+    @property
+    def calculate_duration(self):
+        return self.format_duration(self.check_in_time, self.check_out_time)
+
+class AttendanceEvent(models.Model):
+    """Append-only log of recognition punches.
+
+    With ATTENDANCE_WRITE_MODE = 'events' the kiosks only insert here and
+    the rollup_attendance command derives AttendanceRecord from the punches.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_events')
+    camera = models.ForeignKey('CameraConfiguration', on_delete=models.SET_NULL, null=True, blank=True)
+    timestamp = models.DateTimeField(help_text="When the face was recognised")
+    distance = models.FloatField(null=True, blank=True, help_text="Face distance of the match")
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['employee', 'timestamp'])]
+
+    def __str__(self):
+        return f"Punch #{self.id}: employee {self.employee_id} at {self.timestamp}"
+
+class AttendanceRollupCheckpoint(models.Model):
+    """Last AttendanceEvent id folded into AttendanceRecord by a roll-up job"""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: event #{self.last_event_id}"
+
+class MonthlyAttendanceSummary(models.Model):
+    """Per-employee attendance totals for one month, kept current by attendance_summary"""
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='monthly_summaries')
+    month = models.DateField(help_text="First day of the month")
+    # Not PositiveIntegerField: writes add signed deltas to these counters in place
+    records = models.IntegerField(default=0)
+    days_present = models.IntegerField(default=0)
+    total_hours = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_work_units = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['employee', 'month']
+
+    def __str__(self):
+        return f"{self.employee_id} {self.month:%Y-%m}: {self.total_work_units} công"
+
+class DailyDepartmentSummary(models.Model):
+    """Per-department attendance totals for one day, kept current by attendance_summary"""
+    date = models.DateField()
+    department_key = models.BigIntegerField(help_text="Department id, 0 for employees without a department")  # Not a FK: NULL would defeat the unique key
+    records = models.IntegerField(default=0)
+    present = models.IntegerField(default=0)
+    total_hours = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_work_units = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['date', 'department_key']
+
+    def __str__(self):
+        return f"{self.date} department {self.department_key}: {self.present}/{self.records} present"
+
 class PayRate(models.Model):
     position = models.CharField(max_length=100)
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2)
@@ -162,32 +279,51 @@ class Payroll(models.Model):
     net_pay = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    class Meta:
+        unique_together = ['employee', 'pay_period']
+    
     def __str__(self):
         return f"Payroll for {self.employee.first_name} {self.employee.last_name} - {self.pay_period}"
     
-    def calculate_pay(self):
-        """Tính lương dựa trên số công và mức lương ngày công"""
+    def calculate_pay(self, total_work_units=None):
+        """Tính lương dựa trên số công và mức lương ngày công
+
+        ``total_work_units`` can be passed when already totalled (e.g. by
+        attendance_totals.with_totals for a whole pay period).
+        """
         # Tính tổng số công
-        self.total_work_units = self.employee.calculate_total_work_units(
-            self.pay_period.start_date, 
-            self.pay_period.end_date
+        if total_work_units is None:
+            total_work_units = self.employee.calculate_total_work_units(
+                self.pay_period.start_date,
+                self.pay_period.end_date
+            )
+        self.total_work_units = total_work_units
+
+        # Lương gộp, khấu trừ (20% thuế và bảo hiểm) và lương thực nhận
+        self.gross_pay, self.deductions, self.net_pay = pay_breakdown(
+            self.total_work_units, self.employee.daily_rate
         )
-        
-        # Tính lương gộp
-        self.gross_pay = self.total_work_units * self.employee.daily_rate
-        
-        # Khấu trừ (giả định 20% thuế và bảo hiểm)
-        self.deductions = self.gross_pay * Decimal('0.2')
-        
-        # Lương thực nhận
-        self.net_pay = self.gross_pay - self.deductions
-        
+
         self.save()
 
 class CameraConfiguration(models.Model):
     name = models.CharField(max_length=100, unique=True, help_text="Give a name to this camera configuration")
     camera_source = models.CharField(max_length=255, help_text="Camera index (0 for default webcam or RTSP/HTTP URL for IP camera)")
     threshold = models.FloatField(default=0.6, help_text="Face recognition confidence threshold")
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, help_text="Match employees of this department first")
+    detection_scale = models.FloatField(null=True, blank=True, help_text="Downscale factor for face detection, e.g. 0.5 (blank = fit FACE_DETECTION_MAX_SIDE)")
+    DETECTOR_MODEL_CHOICES = (
+        ('hog', 'HOG (fast, CPU)'),
+        ('cnn', 'CNN (accurate, slow without GPU)'),
+    )
+    DETECTOR_CASCADE_CHOICES = (
+        ('', 'None'),
+        ('haar', 'OpenCV Haar cascade'),
+        ('lbp', 'OpenCV LBP cascade'),
+    )
+    detector_model = models.CharField(max_length=10, choices=DETECTOR_MODEL_CHOICES, default='hog', help_text="dlib face detector")
+    detector_upsample = models.PositiveSmallIntegerField(default=1, help_text="Times the frame is upsampled to find smaller faces (0 = fastest)")
+    detector_cascade = models.CharField(max_length=10, choices=DETECTOR_CASCADE_CHOICES, blank=True, default='', help_text="Cheap first-pass detector; dlib only runs where it finds a candidate face")
 
     def __str__(self):
         return self.name
\ No newline at end of file
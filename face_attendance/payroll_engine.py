@@ -0,0 +1,133 @@
+"""
+Bulk payroll run for a pay period (the calculate_payroll command).
+
+Each shard (a set of departments) totals its employees' work units with one
+grouped query (attendance_totals.with_totals). It then writes its Payroll rows
+with ``bulk_create(update_conflicts=True)`` in chunks, inside one
+transaction: an existing (employee, pay_period) row gets its amounts
+updated and keeps its status. Shards can run in separate processes.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from .attendance_totals import pay_breakdown, with_totals
+from .models import Employee, PayPeriod, Payroll
+
+UPDATE_FIELDS = ['total_work_units', 'gross_pay', 'deductions', 'net_pay']
+
+
+@dataclass
+class ShardResult:
+    """What one shard computed (and wrote, unless a dry run), with the time each step took"""
+    departments: list
+    employees: int = 0
+    total_work_units: Decimal = Decimal('0')
+    net_pay: Decimal = Decimal('0')
+    query_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    write_seconds: float = 0.0
+    payrolls: list = field(default_factory=list, repr=False)
+
+
+def plan_shards(shards, department_ids=None):
+    """
+    Split the departments of active employees into ``shards`` groups of about
+    equal head count. ``None`` stands for employees without a department.
+    """
+    counts = (
+        Employee.objects.filter(is_active=True)
+        .values('department_id').annotate(employees=Count('id'))
+        .order_by('-employees')
+    )
+    if department_ids is not None:
+        counts = counts.filter(department_id__in=department_ids)
+    groups = [[] for _ in range(max(1, shards))]
+    load = [0] * len(groups)
+    for row in counts:
+        smallest = load.index(min(load))
+        groups[smallest].append(row['department_id'])
+        load[smallest] += row['employees']
+    return [group for group in groups if group]
+
+
+def _department_filter(departments):
+    condition = Q(department_id__in=[department for department in departments if department is not None])
+    if None in departments:
+        condition |= Q(department__isnull=True)
+    return condition
+
+
+def run_shard(pay_period_id, departments, dry_run=False, chunk_size=1000):
+    """Compute (and unless ``dry_run`` write) the payrolls of the active employees in ``departments``"""
+    result = ShardResult(departments=departments)
+    pay_period = PayPeriod.objects.get(id=pay_period_id)
+
+    started = time.perf_counter()
+    employees = list(
+        with_totals(
+            Employee.objects.filter(_department_filter(departments), is_active=True),
+            pay_period.start_date, pay_period.end_date,
+        ).only('id', 'daily_rate')
+    )
+    result.query_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for employee in employees:
+        gross, deductions, net = pay_breakdown(employee.total_work_units, employee.daily_rate)
+        result.payrolls.append(Payroll(
+            employee_id=employee.id,
+            pay_period_id=pay_period_id,
+            total_work_units=employee.total_work_units,
+            gross_pay=gross,
+            deductions=deductions,
+            net_pay=net,
+        ))
+        result.total_work_units += employee.total_work_units
+        result.net_pay += net
+    result.employees = len(employees)
+    result.compute_seconds = time.perf_counter() - started
+
+    if not dry_run and result.payrolls:
+        started = time.perf_counter()
+        with transaction.atomic():
+            for i in range(0, len(result.payrolls), chunk_size):
+                Payroll.objects.bulk_create(
+                    result.payrolls[i:i + chunk_size],
+                    update_conflicts=True,
+                    unique_fields=['employee', 'pay_period'],
+                    update_fields=UPDATE_FIELDS,
+                )
+        result.write_seconds = time.perf_counter() - started
+    return result
+
+
+def _setup_worker():
+    # spawn starts a fresh interpreter: configure Django before touching models
+    import django
+    django.setup()
+
+
+def _run_shard_in_worker(args):
+    result = run_shard(*args)
+    result.payrolls = []  # Not needed by the parent; keeps the pickled result small
+    connection.close()
+    return result
+
+
+def run_payroll(pay_period_id, shards, workers=1, dry_run=False, chunk_size=1000):
+    """Run every shard, in ``workers`` processes when more than one; returns the ShardResults"""
+    jobs = [(pay_period_id, departments, dry_run, chunk_size) for departments in shards]
+    if workers <= 1 or len(jobs) <= 1:
+        return [run_shard(*job) for job in jobs]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_setup_worker,
+    ) as executor:
+        return list(executor.map(_run_shard_in_worker, jobs))
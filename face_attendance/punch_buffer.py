@@ -0,0 +1,313 @@
+"""
+Write-behind buffer for attendance punches (ATTENDANCE_WRITE_BEHIND).
+
+In 'events' write mode a recognition normally inserts its AttendanceEvent
+before the kiosk gets an answer. With the buffer, punches are appended to a
+local spool file (fsync'd, one JSON line per punch) and queued in memory.
+The kiosk is answered at once, and a background thread inserts the queue
+with one ``bulk_create`` when ATTENDANCE_BUFFER_MAX_SIZE punches are waiting
+or the oldest has waited ATTENDANCE_BUFFER_MAX_DELAY seconds.
+
+Each process spools to its own file in ATTENDANCE_SPOOL_DIR, holding a lock
+on it (flock, or msvcrt.locking on Windows). On start, spool files left by
+processes that died (no lock held) are replayed, so a crash loses no
+punches. Without file locks only the process's own leftover spool is
+replayed. A punch replayed after its insert had already committed is
+harmless: the roll-up drops repeats inside the repeat window.
+"""
+import atexit
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+
+from .models import AttendanceEvent
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+SPOOL_PATTERN = 'punches-*.jsonl'
+# msvcrt locks are mandatory, so lock one byte far past the punches rather than the punches themselves
+MSVCRT_LOCK_OFFSET = 2 ** 30
+
+
+def write_behind():
+    return getattr(settings, 'ATTENDANCE_WRITE_BEHIND', False)
+
+
+def _lock(spool_file):
+    """
+    Take the spool file's lock without blocking; False if another process
+    holds it, or if the platform has no file locks (a live process's spool
+    then cannot be told from an orphaned one).
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(spool_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+    if msvcrt is None:
+        return False
+    fd = spool_file.fileno()
+    os.lseek(fd, MSVCRT_LOCK_OFFSET, os.SEEK_SET)
+    try:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    finally:
+        os.lseek(fd, 0, os.SEEK_END)
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # Windows cannot remove a file another process has open; it is empty, so leave it
+        pass
+
+
+def _fsync_write(spool_file, lines):
+    spool_file.write(''.join(lines))
+    spool_file.flush()
+    os.fsync(spool_file.fileno())
+
+
+def _punch_line(punch):
+    return json.dumps({
+        'employee_id': punch['employee_id'],
+        'camera_id': punch['camera_id'],
+        'timestamp': punch['timestamp'].isoformat(),
+        'distance': punch['distance'],
+    }) + '\n'
+
+
+def _read_spool(path):
+    """Punches in a spool file; a line cut short by a crash is skipped"""
+    punches = []
+    with open(path, encoding='utf-8') as spool_file:
+        for line in spool_file:
+            try:
+                punch = json.loads(line)
+                punch['timestamp'] = datetime.datetime.fromisoformat(punch['timestamp'])
+            except (ValueError, KeyError):
+                print(f"Skipping unreadable punch in {path}: {line!r}")
+                continue
+            punches.append(punch)
+    return punches
+
+
+class PunchBuffer:
+    """In-memory punch queue backed by an append-only spool file, flushed by a daemon thread"""
+
+    def __init__(self, spool_dir, max_size=200, max_delay=1.0):
+        self.spool_dir = spool_dir
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.spool_path = os.path.join(spool_dir, f'punches-{os.getpid()}.jsonl')
+        self._pending = []  # punch dicts, oldest first; kept until their insert commits
+        self._oldest = None  # time.monotonic() when the oldest pending punch arrived
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._spool = None
+        # Metrics
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.replayed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            spool_dir=getattr(settings, 'ATTENDANCE_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'spool')),
+            max_size=getattr(settings, 'ATTENDANCE_BUFFER_MAX_SIZE', 200),
+            max_delay=getattr(settings, 'ATTENDANCE_BUFFER_MAX_DELAY', 1.0),
+        )
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool = open(self.spool_path, 'a+', encoding='utf-8')
+        _lock(self._spool)
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name='punch-buffer', daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        """Queue the punches of our own leftover spool and of every unlocked (orphaned) one"""
+        punches = []
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, SPOOL_PATTERN))):
+            if path == self.spool_path:
+                punches.extend(_read_spool(path))
+                continue
+            with open(path, 'a+', encoding='utf-8') as orphan:
+                if not _lock(orphan):
+                    continue  # Spool of a live process (or no locks to tell)
+                punches.extend(_read_spool(path))
+                # Emptied under the lock; removed once closed, as Windows cannot remove an open file
+                orphan.truncate(0)
+            _remove(path)
+        if punches:
+            print(f"Replaying {len(punches)} spooled attendance punches")
+            with self._condition:
+                self._pending = punches
+                self._oldest = time.monotonic()
+                self._rewrite_spool()
+            self.replayed += len(punches)
+
+    def _rewrite_spool(self):
+        # Called with the condition held: the spool becomes exactly the pending punches
+        self._spool.seek(0)
+        self._spool.truncate()
+        _fsync_write(self._spool, [_punch_line(punch) for punch in self._pending])
+
+    def add(self, punches):
+        """
+        Queue punches (dicts of employee_id, camera_id, timestamp, distance).
+        Returns once they are on disk.
+        """
+        with self._condition:
+            _fsync_write(self._spool, [_punch_line(punch) for punch in punches])
+            was_empty = not self._pending
+            if was_empty:
+                self._oldest = time.monotonic()
+            self._pending.extend(punches)
+            # Wake the flush thread to start the max_delay timer, or to flush a full batch
+            if was_empty or len(self._pending) >= self.max_size:
+                self._condition.notify()
+
+    def pending_punches(self, employee_ids, start, end):
+        """(employee_id, timestamp) of queued punches not yet known to be in the database"""
+        with self._condition:
+            return [
+                (punch['employee_id'], punch['timestamp']) for punch in self._pending
+                if punch['employee_id'] in employee_ids and start <= punch['timestamp'] < end
+            ]
+
+    def _due(self):
+        if self._stopping or len(self._pending) >= self.max_size:
+            return True
+        return bool(self._pending) and time.monotonic() - self._oldest >= self.max_delay
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._due():
+                        timeout = None
+                        if self._pending:
+                            timeout = max(0.0, self._oldest + self.max_delay - time.monotonic())
+                        self._condition.wait(timeout)
+                    if not self._pending:
+                        return  # Stopping with nothing left to flush
+                    batch = self._pending[:self.max_size]
+                if not self.flush_batch(batch):
+                    if self._stopping:
+                        return  # The spool keeps the punches for the next start
+                    time.sleep(self.max_delay)  # Database unavailable: retry the same batch later
+        finally:
+            connection.close()
+
+    def flush_batch(self, batch):
+        """Insert ``batch`` (the head of the queue) and drop it from the queue and spool"""
+        started = time.perf_counter()
+        close_old_connections()
+        try:
+            self._insert(batch)
+        except Exception:
+            self.failures += 1
+            print("Error flushing attendance punches:")
+            traceback.print_exc()
+            return False
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._condition:
+            del self._pending[:len(batch)]
+            self._oldest = time.monotonic() if self._pending else None
+            self._rewrite_spool()
+            self.flushed += len(batch)
+            self.flushes += 1
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        return True
+
+    def _insert(self, batch):
+        events = [AttendanceEvent(**punch) for punch in batch]
+        try:
+            with transaction.atomic():
+                AttendanceEvent.objects.bulk_create(events)
+            return
+        except IntegrityError:
+            pass
+        # An employee or camera was deleted while its punch waited: insert one by
+        # one, dropping the camera and then the punch for the rows that fail
+        for event in events:
+            try:
+                with transaction.atomic():
+                    event.save()
+                continue
+            except IntegrityError:
+                event.pk = None
+            if event.camera_id is not None:
+                event.camera_id = None
+                try:
+                    with transaction.atomic():
+                        event.save()
+                    continue
+                except IntegrityError:
+                    event.pk = None
+            print(f"Dropping punch for missing employee {event.employee_id} at {event.timestamp}")
+
+    def stop(self, timeout=10.0):
+        """Flush what is queued and stop the thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Queue depth, age of the oldest queued punch and flush counters (latency in ms)"""
+        with self._condition:
+            depth = len(self._pending)
+            oldest = time.monotonic() - self._oldest if self._pending else 0.0
+        return {
+            'depth': depth,
+            'oldest_age': round(oldest, 3),
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'replayed': self.replayed,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'max_flush_ms': round(self.max_flush_ms, 1),
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Process-wide PunchBuffer, started (and its spool replayed) on first use"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = PunchBuffer.from_settings()
+            _buffer.start()
+            atexit.register(_buffer.stop)
+        return _buffer
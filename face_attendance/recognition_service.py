@@ -0,0 +1,193 @@
+"""
+Recognition service: runs the CPU-heavy dlib face detection and encoding in a
+pool of pre-warmed worker processes instead of on the web request thread.
+
+Views submit JPEG bytes and wait for the encodings with a timeout. The number
+of requests queued or running is bounded; once the bound is reached new
+submissions fail fast with ``RecognitionBusy`` so the web workers stay free
+for other pages. If a worker process dies (killed, or crashed in native
+code), the pool is replaced and the affected jobs are retried once.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .face_detection import get_pipeline
+
+
+class RecognitionBusy(Exception):
+    """Raised when the recognition queue is full"""
+
+
+class RecognitionTimeout(Exception):
+    """Raised when a recognition job does not finish in time"""
+
+
+def _warm_up():
+    # Runs once in each worker: loads the dlib models into that process
+    get_pipeline().detect(np.zeros((64, 64, 3), dtype=np.uint8))
+
+
+def detect_and_encode(image_bytes, options=None):
+    """
+    Decode a JPEG/PNG and encode every face in it.
+    ``options`` are passed to FacePipeline.process (scale, max_side,
+    pre_cropped, detector). Returns a face_detection.FrameFaces, or None when
+    the bytes are not a decodable image.
+    """
+    frame = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    return get_pipeline().process(frame, **(options or {}))
+
+
+class RecognitionService:
+    """Bounded process pool for recognition jobs; ``workers=0`` runs jobs inline"""
+
+    def __init__(self, workers=2, queue_size=16, timeout=10.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            workers=getattr(settings, 'FACE_WORKER_PROCESSES', 2),
+            queue_size=getattr(settings, 'FACE_WORKER_QUEUE_SIZE', 16),
+            timeout=getattr(settings, 'FACE_WORKER_TIMEOUT', 10.0),
+        )
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web server process is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up,
+                )
+            return self._executor
+
+    def _discard(self, executor):
+        """Forget a broken pool so the next job starts a new one (unless another thread already did)"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, args):
+        # (executor, future), so a caller whose job breaks the pool knows which one to discard
+        if not self._slots.acquire(blocking=False):
+            raise RecognitionBusy('Recognition queue is full')
+        try:
+            executor = self.executor
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died since the last job
+                self._discard(executor)
+                executor = self.executor
+                future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the job really finishes, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        return executor, future
+
+    def submit(self, fn, *args):
+        """Queue a job; raises RecognitionBusy when ``queue_size`` jobs are pending"""
+        return self._submit(fn, args)[1]
+
+    def result(self, future, timeout=None):
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RecognitionTimeout('Recognition timed out')
+
+    def run(self, fn, *args):
+        """Run a job in the pool and wait for its result"""
+        if not self.workers:
+            return fn(*args)
+        executor, future = self._submit(fn, args)
+        try:
+            return self.result(future)
+        except BrokenProcessPool:
+            self._discard(executor)
+            return self.result(self.submit(fn, *args))
+
+    def run_many(self, fn, args_list):
+        """Run one job per argument tuple concurrently; results keep the input order"""
+        if not self.workers:
+            return [fn(*args) for args in args_list]
+        jobs = [self._submit(fn, args) for args in args_list]
+        results = [None] * len(jobs)
+        retry = []
+        for index, (executor, future) in enumerate(jobs):
+            try:
+                results[index] = self.result(future)
+            except BrokenProcessPool:
+                self._discard(executor)
+                retry.append(index)
+        # Every job the broken pool lost is resubmitted at once, to the new pool
+        for index, future in [(index, self.submit(fn, *args_list[index])) for index in retry]:
+            results[index] = self.result(future)
+        return results
+
+    async def arun(self, fn, *args):
+        """Awaitable ``run``: the event loop is free while the job runs"""
+        if not self.workers:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        executor, future = self._submit(fn, args)
+        try:
+            return await self._await(future)
+        except BrokenProcessPool:
+            self._discard(executor)
+            return await self._await(self.submit(fn, *args))
+
+    async def _await(self, future):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise RecognitionTimeout('Recognition timed out')
+
+    def encode_faces(self, image_bytes, options=None):
+        return self.run(detect_and_encode, image_bytes, options)
+
+    async def aencode_faces(self, image_bytes, options=None):
+        return await self.arun(detect_and_encode, image_bytes, options)
+
+    def encode_faces_many(self, images, options=None):
+        return self.run_many(detect_and_encode, [(image_bytes, options) for image_bytes in images])
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """Process-wide RecognitionService configured from settings"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RecognitionService.from_settings()
+        return _service
@@ -0,0 +1,90 @@
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import attendance_summary
+from .face_gallery import notify_changed
+from .models import AttendanceRecord, Employee, FaceEncoding
+
+# Employee fields mirrored in the face gallery
+GALLERY_FIELDS = ('is_active', 'department_id')
+
+
+@receiver(post_save, sender=FaceEncoding)
+@receiver(post_delete, sender=FaceEncoding)
+def face_encoding_changed(sender, instance, **kwargs):
+    notify_changed(instance.employee_id)
+
+
+def _gallery_state(instance):
+    # Read through __dict__ so deferred loads do not trigger a query per instance
+    return tuple(instance.__dict__.get(field) for field in GALLERY_FIELDS)
+
+
+@receiver(post_init, sender=Employee)
+def remember_employee_state(sender, instance, **kwargs):
+    instance._gallery_state = _gallery_state(instance)
+    # DEFERRED when not loaded: the stored department is then unknown
+    instance._stored_department_id = instance.__dict__.get('department_id', DEFERRED)
+
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, **kwargs):
+    # Only activation or department changes affect the gallery; new employees have no encodings yet
+    state = _gallery_state(instance)
+    if not created and state != instance._gallery_state:
+        notify_changed(instance.pk)
+    instance._gallery_state = state
+    # Daily summaries count records under the employee's current department
+    old_department_id = instance._stored_department_id
+    if not created and old_department_id is not DEFERRED and old_department_id != instance.department_id:
+        attendance_summary.move_employee(instance, old_department_id)
+    instance._stored_department_id = instance.department_id
+
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, **kwargs):
+    notify_changed(instance.pk)
+
+
+@receiver(pre_delete, sender=Employee)
+def employee_deleting(sender, instance, **kwargs):
+    # One grouped update instead of a summary change per cascaded record
+    attendance_summary.forget_employee(instance)
+
+
+def _summary_state(instance):
+    # (employee_id, date, contribution) as stored, or None for a partly loaded record
+    fields = instance.__dict__
+    if fields.get('employee_id') is None or fields.get('date') is None:
+        return None
+    return fields['employee_id'], fields['date'], attendance_summary.contribution(instance)
+
+
+@receiver(post_init, sender=AttendanceRecord)
+def remember_summary_state(sender, instance, **kwargs):
+    instance._summary_state = _summary_state(instance)
+
+
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_record_saved(sender, instance, created, **kwargs):
+    deltas = attendance_summary.SummaryDeltas()
+    if not created and instance._summary_state is not None:
+        deltas.add(*instance._summary_state, sign=-1)
+    instance._summary_state = _summary_state(instance)
+    if instance._summary_state is not None:
+        deltas.add(*instance._summary_state)
+    if AttendanceRecord.employee.is_cached(instance):
+        deltas.departments[instance.employee_id] = instance.employee.department_id
+    deltas.apply()
+
+
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_record_deleted(sender, instance, origin=None, **kwargs):
+    # Records deleted with their employee were already handled by employee_deleting
+    if isinstance(origin, Employee) or getattr(origin, 'model', None) is Employee:
+        return
+    if instance._summary_state is not None:
+        deltas = attendance_summary.SummaryDeltas()
+        deltas.add(*instance._summary_state, sign=-1)
+        deltas.apply()
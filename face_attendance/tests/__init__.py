@@ -0,0 +1,16 @@
+import datetime
+
+
+def employee(employee_id='EMP001', model=None, **fields):
+    """
+    Create an employee with every required field filled in; ``fields``
+    override the defaults. Migration tests pass the historical model.
+    """
+    # Imported here: recognition worker processes import this package without setting up Django
+    from face_attendance.models import Employee
+
+    defaults = {
+        'first_name': 'An', 'last_name': 'Nguyen', 'email': f'{employee_id.lower()}@example.com',
+        'phone': '0900000000', 'position': 'Staff', 'date_hired': datetime.date(2024, 1, 1),
+    }
+    return (model or Employee).objects.create(employee_id=employee_id, **{**defaults, **fields})
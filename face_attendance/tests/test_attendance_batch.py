@@ -0,0 +1,52 @@
+import base64
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from face_attendance.models import AttendanceRecord
+from face_attendance.tests import employee
+
+
+def _face(top):
+    return SimpleNamespace(location=(top, 100, top + 80, 20), encoding=np.zeros(128, np.float32))
+
+
+@override_settings(ATTENDANCE_WRITE_MODE='upsert')
+class MarkAttendanceBatchTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('kiosk', password='x'))
+        self.employee = employee()
+
+    def post_frames(self, frame_faces, matches):
+        service = mock.Mock()
+        service.encode_faces_many.return_value = frame_faces
+        with mock.patch('face_attendance.views.get_recognition_service', return_value=service), \
+                mock.patch('face_attendance.views.gallery.match_many', return_value=matches):
+            frames = [base64.b64encode(b'frame').decode() for _ in frame_faces]
+            response = self.client.post(
+                reverse('face_attendance:mark_attendance_batch'),
+                json.dumps({'frames': frames}), content_type='application/json',
+            )
+        return response.json()
+
+    def test_every_face_keeps_its_match(self):
+        # The employee in both frames (the second face is closer), and a stranger
+        data = self.post_frames(
+            [[_face(10)], [_face(20), _face(200)]],
+            [(self.employee.pk, 0.45), (self.employee.pk, 0.30), (None, 0.80)],
+        )
+
+        self.assertTrue(data['success'])
+        results = data['results']
+        self.assertEqual([face['employee_id'] for face in results], ['EMP001', 'EMP001', None])
+        self.assertEqual([face['distance'] for face in results], [0.45, 0.30, 0.80])
+        # Only the closest face of the employee is used for the attendance write
+        self.assertEqual([face['recorded'] for face in results], [False, True, False])
+        self.assertEqual([face['action'] for face in results], [None, 'check_in', None])
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.employee).count(), 1)
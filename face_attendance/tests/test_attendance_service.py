@@ -0,0 +1,45 @@
+import datetime
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from face_attendance.models import AttendanceEvent
+from face_attendance.tests import employee
+
+
+@override_settings(
+    ATTENDANCE_WRITE_MODE='events', ATTENDANCE_WRITE_BEHIND=False,
+    FACE_ATTENDANCE_REPEAT_WINDOW=60, FACE_RECOGNITION_CACHE_TTL=0,
+)
+class EventsModeResponseTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('kiosk', password='x'))
+        self.employee = employee()
+
+    def punch(self, hour):
+        service = mock.Mock()
+        service.encode_faces.return_value = [SimpleNamespace(encoding=np.zeros(128, np.float32))]
+        now = datetime.datetime(2026, 3, 2, hour, 0, tzinfo=datetime.timezone.utc)
+        with mock.patch('face_attendance.views.get_recognition_service', return_value=service), \
+                mock.patch('face_attendance.views.gallery.match', return_value=(self.employee.pk, 0.35)), \
+                mock.patch('face_attendance.views.timezone.now', return_value=now):
+            response = self.client.post(
+                reverse('face_attendance:mark_attendance'),
+                json.dumps({'image_data': 'ZnJhbWU='}), content_type='application/json',
+            )
+        return response.json()
+
+    def test_each_punch_reports_its_own_time(self):
+        self.assertEqual(self.punch(8)['check_in_time'], '08:00:00')
+        self.assertEqual(self.punch(12)['check_out_time'], '12:00:00')
+        # Checked in again: the day's record still starts at 08:00
+        data = self.punch(13)
+        self.assertTrue(data['check_in'])
+        self.assertEqual(data['check_in_time'], '13:00:00')
+        self.assertEqual(AttendanceEvent.objects.count(), 3)
@@ -0,0 +1,131 @@
+import datetime
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from face_attendance import attendance_summary
+from face_attendance.attendance_service import record_face_attendance, rollup_events
+from face_attendance.models import (
+    AttendanceEvent, AttendanceRecord, DailyDepartmentSummary, Department, Employee, MonthlyAttendanceSummary,
+)
+from face_attendance.tests import employee
+
+
+def _summaries():
+    """Stored summary rows, ignoring rows whose counters have gone back to zero"""
+    monthly = {
+        (row['employee_id'], row['month']): row
+        for row in MonthlyAttendanceSummary.objects.filter(records__gt=0)
+        .values('employee_id', 'month', 'records', 'days_present', 'total_hours', 'total_work_units')
+    }
+    daily = {
+        (row['date'], row['department_key']): row
+        for row in DailyDepartmentSummary.objects.filter(records__gt=0)
+        .values('date', 'department_key', 'records', 'present', 'total_hours', 'total_work_units')
+    }
+    return monthly, daily
+
+
+@override_settings(ATTENDANCE_WRITE_MODE='upsert', FACE_ATTENDANCE_REPEAT_WINDOW=60)
+class AttendanceSummaryTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Kho', location='HN')
+        self.employee = employee('EMP001', department=self.department)
+        self.other = employee('EMP002', department=self.department)
+
+    def assertMatchesRebuild(self):
+        stored = _summaries()
+        attendance_summary.rebuild(datetime.date(2026, 1, 1), datetime.date(2026, 12, 31))
+        self.assertEqual(stored, _summaries())
+
+    def test_check_in_and_out_add_to_summaries(self):
+        check_in = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        record_face_attendance(self.employee, check_in)
+        record_face_attendance(self.other, check_in)
+        record_face_attendance(self.employee, check_in + datetime.timedelta(hours=8))
+
+        day = DailyDepartmentSummary.objects.get(date=check_in.date(), department_key=self.department.pk)
+        self.assertEqual((day.records, day.present, day.total_hours), (2, 2, Decimal('8.00')))
+        month = MonthlyAttendanceSummary.objects.get(employee=self.employee, month=datetime.date(2026, 3, 1))
+        self.assertEqual(month.total_work_units, Decimal('1.00'))
+        self.assertMatchesRebuild()
+
+    def test_edits_and_deletes_apply_deltas(self):
+        record = AttendanceRecord.objects.create(
+            employee=self.employee, date=datetime.date(2026, 3, 2), status='present',
+            verification_method='manual', hours_worked=Decimal('4'), work_units=Decimal('0.5'),
+        )
+        AttendanceRecord.objects.create(
+            employee=self.employee, date=datetime.date(2026, 3, 3), status='late',
+            verification_method='manual', hours_worked=Decimal('8'), work_units=Decimal('1'),
+        )
+        record = AttendanceRecord.objects.get(pk=record.pk)
+        record.status = 'absent'
+        record.date = datetime.date(2026, 4, 1)  # Moves the record to another month and day
+        record.save()
+        self.assertMatchesRebuild()
+
+        AttendanceRecord.objects.filter(date=datetime.date(2026, 3, 3)).delete()
+        self.assertMatchesRebuild()
+
+    def test_department_change_moves_daily_totals(self):
+        for day in (2, 3):
+            AttendanceRecord.objects.create(
+                employee=self.employee, date=datetime.date(2026, 3, day), status='present',
+                verification_method='manual', hours_worked=Decimal('8'), work_units=Decimal('1'),
+            )
+        office = Department.objects.create(name='Văn phòng', location='HN')
+
+        moved = Employee.objects.get(pk=self.employee.pk)
+        moved.department = office
+        moved.save()
+        # A later edit of an old record goes to the new department too
+        record = AttendanceRecord.objects.get(employee=moved, date=datetime.date(2026, 3, 2))
+        record.hours_worked = Decimal('6')
+        record.save()
+
+        self.assertEqual(
+            DailyDepartmentSummary.objects.filter(department_key=office.pk, records__gt=0).count(), 2
+        )
+        self.assertMatchesRebuild()
+
+    @override_settings(ATTENDANCE_ROLLUP_LAG=0)
+    def test_rollup_replaces_the_folded_day(self):
+        check_in = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        AttendanceEvent.objects.create(employee=self.employee, timestamp=check_in)
+        rollup_events()
+        AttendanceEvent.objects.create(employee=self.employee, timestamp=check_in + datetime.timedelta(hours=4))
+        rollup_events()
+
+        day = DailyDepartmentSummary.objects.get(date=check_in.date(), department_key=self.department.pk)
+        self.assertEqual((day.records, day.total_hours), (1, Decimal('4.00')))
+        self.assertMatchesRebuild()
+
+    def test_check_in_query_count(self):
+        now = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+        record_face_attendance(self.other, now)
+        # Row lock and insert, then one statement per summary table; the rest are savepoints
+        with self.assertNumQueries(10):
+            record_face_attendance(self.employee, now)
+
+    def test_employee_delete_updates_daily_rows_at_once(self):
+        start = datetime.date(2026, 1, 1)
+        AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(
+                employee=self.employee, date=start + datetime.timedelta(days=offset), status='present',
+                verification_method='manual', hours_worked=Decimal('8'), work_units=Decimal('1'),
+            )
+            for offset in range(300)
+        ])
+        AttendanceRecord.objects.create(
+            employee=self.other, date=start, status='present', verification_method='manual',
+        )
+        attendance_summary.rebuild(start, datetime.date(2026, 12, 31))
+
+        # Collect, one grouped SELECT and two batched summary updates, the cascade deletes
+        with self.assertNumQueries(16):
+            self.employee.delete()
+
+        self.assertEqual(AttendanceRecord.objects.count(), 1)
+        self.assertMatchesRebuild()
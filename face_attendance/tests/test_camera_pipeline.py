@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.test import TransactionTestCase, override_settings
+
+from face_attendance import camera_pipeline
+from face_attendance.camera_pipeline import CameraPipeline
+from face_attendance.models import AttendanceRecord, CameraConfiguration
+from face_attendance.tests import employee
+
+FPS = 50
+# Frames 1-20 and 41-60 show the face, 21-40 an empty scene
+SEGMENTS = ((20, True), (20, False), (20, True))
+FACE_BOX = (60, 200, 180, 80)  # (top, right, bottom, left)
+SAMPLE_EVERY = 2
+
+
+def write_clip(path):
+    """MJPG clip of a moving bar with a sharp 'face' and a white corner marker while it is in view"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), FPS, (320, 240))
+    checkerboard = np.kron((np.indices((15, 15)).sum(axis=0) % 2) * 255, np.ones((8, 8))).astype(np.uint8)
+    number = 0
+    for length, face in SEGMENTS:
+        for _ in range(length):
+            frame = np.full((240, 320, 3), 110, np.uint8)
+            left = (number * 10) % 280
+            frame[200:240, left:left + 40] = 230  # Keeps the motion gate open
+            if face:
+                top, right, bottom, left = FACE_BOX
+                frame[top:bottom, left:right] = checkerboard[:bottom - top, :right - left, None]
+                frame[:16, :16] = 255
+            writer.write(frame)
+            number += 1
+    writer.release()
+
+
+class FakePipeline:
+    """Finds the face by the clip's corner marker; slow enough that the one-frame buffer drops frames"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def detect(self, frame, scale=1.0):
+        time.sleep(0.05)
+        return [FACE_BOX] if frame[:16, :16].mean() > 128 else []
+
+    def encode(self, frame, locations):
+        self.encoded += len(locations)
+        return [SimpleNamespace(encoding=np.zeros(128, np.float32)) for _ in locations]
+
+
+@override_settings(ATTENDANCE_WRITE_MODE='upsert', ATTENDANCE_WRITE_BEHIND=False, FACE_ATTENDANCE_REPEAT_WINDOW=60)
+class CameraPipelineTests(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.clip = os.path.join(directory, 'entrance.avi')
+        write_clip(self.clip)
+        self.camera = CameraConfiguration.objects.create(name='Entrance', camera_source=self.clip, detection_scale=1.0)
+        self.employee = employee()
+        match_many = mock.patch.object(
+            camera_pipeline.gallery, 'match_many',
+            side_effect=lambda encodings, *args, **kwargs: [(self.employee.pk, 0.35)] * len(encodings),
+        )
+        match_many.start()
+        self.addCleanup(match_many.stop)
+
+    def run_pipeline(self, cooldown):
+        events = []
+        pipeline = CameraPipeline([self.camera], sample_every=SAMPLE_EVERY, buffer_size=1,
+                                  cooldown=cooldown, on_event=events.append)
+        worker = pipeline.workers[0]
+        worker.pipeline = FakePipeline()
+        pipeline.start()
+        self.assertTrue(pipeline.join(timeout=30))
+        return pipeline.stats()[0], worker, events
+
+    def test_samples_drops_and_records_once_per_cooldown(self):
+        stats, worker, events = self.run_pipeline(cooldown=300)
+
+        # Every frame read was either handed to the worker or dropped by the full buffer
+        self.assertEqual(stats['read'], 60)
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(worker.frames_seen + stats['dropped'], 60)
+        self.assertEqual(stats['sampled'], (worker.frames_seen + SAMPLE_EVERY - 1) // SAMPLE_EVERY)
+        # One track per visit, each encoded and matched once
+        self.assertEqual((stats['encoded'], stats['matched']), (2, 2))
+        # The second visit falls inside the cooldown
+        self.assertEqual(stats['events'], 1)
+        self.assertEqual([(event.employee.pk, event.action) for event in events], [(self.employee.pk, 'check_in')])
+        record = AttendanceRecord.objects.get()
+        self.assertEqual((record.employee_id, record.verification_method), (self.employee.pk, 'face'))
+        self.assertIsNotNone(record.check_in_time)
+        self.assertIsNone(record.check_out_time)
+
+    def test_each_visit_records_without_cooldown(self):
+        stats, _, events = self.run_pipeline(cooldown=0)
+
+        self.assertEqual(stats['events'], 2)
+        # The second visit is within the repeat window, so it repeats the check-in
+        self.assertEqual([event.action for event in events], ['check_in', 'check_in'])
+        self.assertEqual(AttendanceRecord.objects.count(), 1)
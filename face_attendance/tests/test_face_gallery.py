@@ -0,0 +1,52 @@
+import datetime
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from face_attendance.face_gallery import FaceGallery, GalleryRows, notify_changed
+from face_attendance.models import FaceGalleryChange
+from face_attendance.tests import employee
+
+
+class FaceGallerySyncTests(TestCase):
+
+    def setUp(self):
+        self.employee = employee()
+        self.gallery = FaceGallery()
+
+    def test_sync_after_reload_skips_changes_the_load_included(self):
+        notify_changed(self.employee.pk)
+        self.gallery.reload()
+
+        with mock.patch('face_attendance.face_gallery.load_gallery_rows', return_value=GalleryRows.empty()) as load:
+            self.gallery.sync()
+            load.assert_not_called()
+
+            notify_changed(self.employee.pk)
+            self.gallery.sync()
+            load.assert_called_once_with({self.employee.pk})
+
+    @override_settings(FACE_GALLERY_CHANGE_RETENTION=3600)
+    def test_reload_prunes_old_changes_but_keeps_the_newest(self):
+        notify_changed(self.employee.pk)
+        notify_changed(self.employee.pk)
+        recent = FaceGalleryChange.objects.create(employee_id=self.employee.pk)
+        FaceGalleryChange.objects.exclude(pk=recent.pk).update(created=timezone.now() - datetime.timedelta(hours=2))
+        newest = FaceGalleryChange.objects.create(
+            employee_id=self.employee.pk, created=timezone.now() - datetime.timedelta(hours=2),
+        )
+
+        self.gallery.reload()
+
+        self.assertEqual(list(FaceGalleryChange.objects.order_by('id').values_list('id', flat=True)), [recent.pk, newest.pk])
+        self.assertEqual(self.gallery.version, newest.pk)
+
+    @override_settings(FACE_GALLERY_CHANGE_RETENTION=3600)
+    def test_sync_reloads_after_the_retention_period(self):
+        self.gallery.reload()
+        self.gallery._last_sync -= 3600
+
+        with mock.patch.object(self.gallery, 'reload') as reload:
+            self.gallery.sync()
+            reload.assert_called_once_with()
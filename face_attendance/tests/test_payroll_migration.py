@@ -0,0 +1,63 @@
+import datetime
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from face_attendance.tests import employee
+
+BEFORE = [('face_attendance', '0007_attendanceevent')]
+AFTER = [('face_attendance', '0008_payroll_unique_employee_period')]
+
+
+class PayrollDedupeMigrationTests(TransactionTestCase):
+    """0008 keeps one payroll per (employee, pay period) without dropping a settled one"""
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(BEFORE)
+        apps = self.executor.loader.project_state(BEFORE).apps
+        self.Payroll = apps.get_model('face_attendance', 'Payroll')
+        Employee = apps.get_model('face_attendance', 'Employee')
+        PayPeriod = apps.get_model('face_attendance', 'PayPeriod')
+        self.employee = employee(model=Employee)
+        self.period = PayPeriod.objects.create(
+            start_date=datetime.date(2026, 3, 1), end_date=datetime.date(2026, 3, 31),
+            payment_date=datetime.date(2026, 4, 5),
+        )
+
+    def tearDown(self):
+        self.Payroll.objects.all().delete()
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def payroll(self, status):
+        return self.Payroll.objects.create(employee=self.employee, pay_period=self.period, status=status).id
+
+    def migrate(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(AFTER)
+
+    def test_keeps_the_paid_row_over_newer_pending_ones(self):
+        paid = self.payroll('paid')
+        self.payroll('pending')
+        self.payroll('pending')
+
+        self.migrate()
+
+        self.assertEqual(list(self.Payroll.objects.values_list('id', flat=True)), [paid])
+
+    def test_keeps_the_newest_of_pending_rows(self):
+        self.payroll('pending')
+        newest = self.payroll('pending')
+
+        self.migrate()
+
+        self.assertEqual(list(self.Payroll.objects.values_list('id', flat=True)), [newest])
+
+    def test_stops_on_two_settled_rows(self):
+        first, second = self.payroll('paid'), self.payroll('processed')
+
+        with self.assertRaisesMessage(RuntimeError, f'#{first} (paid), #{second} (processed)'):
+            self.migrate()
+        self.assertEqual(self.Payroll.objects.count(), 2)
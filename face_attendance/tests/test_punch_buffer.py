@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from face_attendance import punch_buffer
+from face_attendance.models import AttendanceEvent
+from face_attendance.punch_buffer import PunchBuffer, _punch_line
+from face_attendance.tests import employee
+
+
+class PunchBufferTests(TransactionTestCase):
+    # The flush thread uses its own connection, so rows must really be committed
+
+    def setUp(self):
+        self.employee = employee()
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+
+    def punch(self):
+        return {'employee_id': self.employee.pk, 'camera_id': None, 'timestamp': timezone.now(), 'distance': 0.4}
+
+    def wait_for_events(self, count, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if AttendanceEvent.objects.count() >= count:
+                    return True
+            except OperationalError:
+                pass  # The in-memory SQLite test database locks the table while the flush thread writes
+            time.sleep(0.05)
+        return False
+
+    def test_single_punch_flushed_within_max_delay(self):
+        buffer = PunchBuffer(self.spool_dir, max_size=200, max_delay=0.3)
+        buffer.start()
+        self.addCleanup(buffer.stop)
+
+        buffer.add([self.punch()])
+
+        self.assertTrue(self.wait_for_events(1, timeout=0.3 + 1.0))
+        stats = buffer.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['flushes'], 1)
+        with open(buffer.spool_path, encoding='utf-8') as spool:
+            self.assertEqual(spool.read(), '')
+
+    def test_full_batch_flushed_without_waiting(self):
+        buffer = PunchBuffer(self.spool_dir, max_size=3, max_delay=60)
+        buffer.start()
+        self.addCleanup(buffer.stop)
+
+        buffer.add([self.punch() for _ in range(3)])
+
+        self.assertTrue(self.wait_for_events(3, timeout=1.0))
+
+    def test_stop_flushes_queue(self):
+        buffer = PunchBuffer(self.spool_dir, max_size=200, max_delay=60)
+        buffer.start()
+        buffer.add([self.punch(), self.punch()])
+
+        buffer.stop()
+
+        self.assertEqual(AttendanceEvent.objects.count(), 2)
+
+    def test_orphaned_spool_replayed(self):
+        orphan = os.path.join(self.spool_dir, 'punches-1.jsonl')
+        with open(orphan, 'w', encoding='utf-8') as spool:
+            spool.write(_punch_line(self.punch()))
+        buffer = PunchBuffer(self.spool_dir, max_size=200, max_delay=60)
+        buffer.start()
+
+        buffer.stop()
+
+        self.assertEqual(buffer.replayed, 1)
+        self.assertEqual(AttendanceEvent.objects.count(), 1)
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_other_spools_left_alone_without_file_locks(self):
+        other = os.path.join(self.spool_dir, 'punches-1.jsonl')
+        with open(other, 'w', encoding='utf-8') as spool:
+            spool.write(_punch_line(self.punch()))
+        buffer = PunchBuffer(self.spool_dir, max_size=200, max_delay=60)
+        with mock.patch.object(punch_buffer, 'fcntl', None), mock.patch.object(punch_buffer, 'msvcrt', None):
+            buffer.start()
+
+        buffer.stop()
+
+        self.assertEqual(buffer.replayed, 0)
+        self.assertEqual(AttendanceEvent.objects.count(), 0)
+        self.assertTrue(os.path.exists(other))
@@ -0,0 +1,45 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from face_attendance import attendance_summary
+from face_attendance.management.commands.check_query_plans import full_scans, render_report, report_checks
+from face_attendance.models import AttendanceRecord, Department
+from face_attendance.tests import employee
+
+
+class ReportQueryPlanTests(TestCase):
+    """The report views stay within their query budgets and never scan a watched table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        department = Department.objects.create(name='Kho', location='HN')
+        # No pay period: payroll_detail.html is not in the repo, so report_checks leaves that page out
+        for number in range(1, 4):
+            staff = employee(
+                f'EMP{number:03}', first_name='Nhân', last_name=f'Viên {number}',
+                department=department, daily_rate=Decimal('300000'),
+            )
+            AttendanceRecord.objects.bulk_create([
+                AttendanceRecord(
+                    employee=staff, date=datetime.date(2026, 3, day), status='present',
+                    verification_method='face', hours_worked=Decimal('8'), work_units=Decimal('1'),
+                )
+                for day in range(1, 32)
+            ])
+        attendance_summary.rebuild(datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_report_budgets_and_plans(self):
+        for name, url, params, budget, check_plans in report_checks('2026-03-01', '2026-03-31'):
+            with self.subTest(name):
+                with self.assertNumQueries(budget):
+                    response, queries = render_report(self.client, url, params)
+                self.assertEqual(response.status_code, 200)
+                if check_plans:
+                    self.assertEqual(full_scans(queries, min_rows=0), [])
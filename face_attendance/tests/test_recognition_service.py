@@ -0,0 +1,57 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from django.test import SimpleTestCase
+
+from face_attendance.recognition_service import RecognitionService
+
+
+# Jobs run in spawned worker processes, so they must be importable module-level functions
+
+def _pid():
+    return os.getpid()
+
+
+def _crash_once(marker):
+    """Kill the worker the first time, as a native crash would; succeed on the retry"""
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'ok'
+
+
+def _crash():
+    os._exit(1)
+
+
+class RecognitionServiceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.service = RecognitionService(workers=1, queue_size=4, timeout=60)
+        self.addCleanup(self.service.shutdown)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.marker = os.path.join(directory, 'crashed')
+
+    def test_run_replaces_a_broken_pool_and_retries(self):
+        first_worker = self.service.run(_pid)
+
+        self.assertEqual(self.service.run(_crash_once, self.marker), 'ok')
+        self.assertNotEqual(self.service.run(_pid), first_worker)
+
+    def test_run_many_retries_the_lost_jobs(self):
+        self.assertEqual(
+            self.service.run_many(_crash_once, [(self.marker,), (self.marker,), (self.marker,)]),
+            ['ok', 'ok', 'ok'],
+        )
+
+    def test_arun_retries_once(self):
+        self.assertEqual(asyncio.run(self.service.arun(_crash_once, self.marker)), 'ok')
+
+    def test_second_crash_is_raised_and_the_pool_recovers(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.service.run(_crash)
+        self.assertIsInstance(self.service.run(_pid), int)
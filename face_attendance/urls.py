@@ -15,6 +15,9 @@ urlpatterns = [
     path('employee_list/', views.employee_list, name='employee_list'),
 
     path('attendance/', views.mark_attendance, name='mark_attendance'),
+    path('attendance/batch/', views.mark_attendance_batch, name='mark_attendance_batch'),
+    path('attendance/async/', views.mark_attendance_async, name='mark_attendance_async'),
+    path('attendance/buffer/', views.attendance_buffer_stats, name='attendance_buffer_stats'),
     path('attendance_list/', views.emp_attendance_list, name='emp_attendance_list'),
 
     # path('employee/<int:employee_id>/', views.employee_detail, name='employee_detail'),
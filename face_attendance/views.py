@@ -6,36 +6,43 @@ from .models import (
 )
 from django.utils import timezone
 from django.db import IntegrityError
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.conf import settings
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
 import datetime
 from datetime import timedelta
-from .face_utils import register_employee_face, recognize_face_for_attendance
+from .face_detection import DetectorConfig
+from .face_gallery import DEFAULT_TOLERANCE, gallery, notify_changed, recognition_scope
+from . import recognition_cache
+from .attendance_service import arecord_face_attendance, record_face_attendance, record_face_attendance_many
+from .punch_buffer import get_buffer, write_behind
+from .attendance_totals import pay_breakdown, record_totals
+from .attendance_summary import day_counts, with_summary_totals
+from .recognition_service import RecognitionBusy, RecognitionTimeout, get_service as get_recognition_service
 
 from django.contrib.auth import authenticate, login, logout
 
 import base64
-import numpy as np
-import cv2
-import face_recognition
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from .models import Employee, FaceEncoding
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 import json
 from django.http import JsonResponse
 from django.utils import timezone
 import csv
-from decimal import Decimal  # Import Decimal for handling currency calculations
 
 def index(request):
     # Calculate statistics for the dashboard
     employee_count = Employee.objects.filter(is_active=True).count()
     today = timezone.now().date()
-    today_attendance_count = AttendanceRecord.objects.filter(date=today).count()
+    today_attendance_count = day_counts(today)['records']
     yesterday = today - timedelta(days=1)
-    yesterday_attendance_count = AttendanceRecord.objects.filter(date=yesterday).count()
+    yesterday_attendance_count = day_counts(yesterday)['records']
     first_day_of_month = today.replace(day=1)
-    month_attendance_count = AttendanceRecord.objects.filter(date__gte=first_day_of_month, date__lte=today).count()
+    month_attendance_count = day_counts(first_day_of_month, today)['records']
     
     # Print values for debugging
     print(f"Employee count: {employee_count}")
@@ -80,110 +87,63 @@ def mark_attendance(request):
     # Handle POST request (receiving the captured image)
     if request.method == 'POST':
         try:
-            # Parse JSON data from the request
-            data = json.loads(request.body)
-            image_data = data.get('image_data', '')
-            
-            # Remove "data:image/jpeg;base64," from the beginning if present
-            if 'base64,' in image_data:
-                image_data = image_data.split('base64,')[1]
+            # Raw/multipart image upload, or the legacy JSON base64 body
+            image_bytes, data = _recognition_payload(request)
             
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data)
-            image_array = np.frombuffer(image_bytes, dtype=np.uint8)
-            frame = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            camera = _camera_from_request(data)
             
-            # Convert BGR to RGB for face_recognition
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # A repeated tap or client retry of the same frame gets the earlier answer
+            cache_key = recognition_cache.cache_key(image_bytes, camera)
+            cached = recognition_cache.get(cache_key)
+            if cached is not None:
+                return JsonResponse(cached)
             
-            # Find faces in the image
-            face_locations = face_recognition.face_locations(rgb_frame)
+            # Detect and encode faces in the recognition worker pool
+            faces = get_recognition_service().encode_faces(
+                image_bytes, _detection_options(camera, data)
+            )
             
-            if not face_locations:
+            if faces is None:
                 return JsonResponse({
-                    'success': False, 
-                    'message': 'No face detected. Please position yourself properly.'
+                    'success': False,
+                    'message': 'Không đọc được ảnh. Vui lòng thử lại.'
                 })
             
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-            
-            if not face_encodings:
-                return JsonResponse({
+            if not faces:
+                return JsonResponse(recognition_cache.remember(cache_key, {
                     'success': False, 
-                    'message': 'Could not encode face. Please try again.'
-                })
+                    'message': 'No face detected. Please position yourself properly.'
+                }))
             
             # Get the first face encoding (assuming one person at a time)
-            face_encoding = face_encodings[0]
+            face_encoding = faces[0].encoding
             
-            # Get all active employees with face encodings
-            all_face_encodings = FaceEncoding.objects.filter(employee__is_active=True)
-            
-            # Match face with database
-            for db_encoding in all_face_encodings:
-                # Get the stored encoding
-                stored_encoding = np.array(db_encoding.get_encoding())
-                
-                # Compare faces
-                matches = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)
-                
-                if matches[0]:
-                    # Face match found
-                    matched_employee = db_encoding.employee
-                    today = timezone.now().date()
-                    now = timezone.now()
-                    
-                    # Check if attendance already exists for today
-                    attendance, created = AttendanceRecord.objects.get_or_create(
-                        employee=matched_employee,
-                        date=today,
-                        defaults={
-                            'check_in_time': now,
-                            'status': 'present',
-                            'verification_method': 'face'
-                        }
-                    )
-                    
-                    if created:
-                        # First check-in for the day
-                        response_data = {
-                            'success': True,
-                            'message': f'Đã điểm danh giờ vào thành công: {matched_employee.first_name} {matched_employee.last_name}',
-                            'check_in': True,
-                            'check_out': False,
-                            'check_in_time': attendance.check_in_time.strftime('%H:%M:%S')
-                        }
-                    else:
-                        # Already checked in, mark checkout
-                        if attendance.check_out_time is None:
-                            attendance.check_out_time = now
-                            attendance.calculate_hours()  # Assuming this method exists in your model
-                            attendance.save()
-                            response_data = {
-                                'success': True,
-                                'message': f'Đã điểm danh giờ ra thành công: {matched_employee.first_name} {matched_employee.last_name}',
-                                'check_in': False,
-                                'check_out': True,
-                                'check_out_time': attendance.check_out_time.strftime('%H:%M:%S')
-                            }
-                        else:
-                            # Already checked out
-                            response_data = {
-                                'success': False,
-                                'message': f'Bạn đã điểm danh đủ cả vào và ra hôm nay.',
-                                'check_in': True,
-                                'check_out': True
-                            }
-                    
-                    return JsonResponse(response_data)
+            # Match face against the in-memory gallery, searching the
+            # camera's department / on-shift employees first
+            tolerance = camera.threshold if camera else DEFAULT_TOLERANCE
+            employee_id, distance = gallery.match(
+                face_encoding, tolerance, department_ids=recognition_scope(camera)
+            )
+
+            if employee_id is not None:
+                # Face match found
+                matched_employee = Employee.objects.get(pk=employee_id)
+                action, _, punch_time = record_face_attendance(
+                    matched_employee, timezone.now(), camera=camera, distance=distance
+                )
             
+                return JsonResponse(recognition_cache.remember(
+                    cache_key, _attendance_response_data(matched_employee, action, punch_time)
+                ))
+
             # If we get here, no matching face was found
-            return JsonResponse({
+            return JsonResponse(recognition_cache.remember(cache_key, {
                 'success': False,
                 'message': 'Không tìm thấy khuôn mặt nào trùng khớp. Vui lòng thử lại.'
-            })
+            }))
                 
+        except (RecognitionBusy, RecognitionTimeout) as e:
+            return _recognition_unavailable(e)
         except Exception as e:
             import traceback
             print(f"Error in mark_attendance: {e}")
@@ -197,6 +157,267 @@ def mark_attendance(request):
     return render(request, 'face_attendance/mark_attendance.html', context)
 
 
+# Request bodies that are the image itself; options then come from the query string
+BINARY_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def _image_bytes(image_data):
+    """Raw JPEG bytes from a base64 string, optionally a data URL"""
+    # Remove "data:image/jpeg;base64," from the beginning if present
+    if 'base64,' in image_data:
+        image_data = image_data.split('base64,')[1]
+    return base64.b64decode(image_data)
+
+def _recognition_payload(request):
+    """
+    (image bytes, options) of a recognition request. Accepts a raw image body
+    with options in the query string, a multipart form with an ``image`` file,
+    or the legacy JSON {"image_data": <base64 data URL>, ...}.
+    """
+    if request.content_type in BINARY_IMAGE_TYPES:
+        # Passed on as-is: cv2.imdecode reads the request buffer without a copy
+        return request.body, request.GET
+    if request.content_type == 'multipart/form-data':
+        upload = request.FILES.get('image')
+        return (upload.read() if upload else b''), request.POST
+    data = json.loads(request.body)
+    return _image_bytes(data.get('image_data', '')), data
+
+def _flag(value):
+    """Truthy JSON value or form/query string ('1', 'true', 'on')"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'on', 'yes')
+    return bool(value)
+
+def _detection_options(camera, data):
+    """Preprocessing options for the recognition workers (see FacePipeline.process)"""
+    return {
+        'scale': camera.detection_scale if camera else None,
+        'max_side': getattr(settings, 'FACE_DETECTION_MAX_SIDE', None),
+        # Clients that crop the face themselves skip server-side detection
+        'pre_cropped': _flag(data.get('face_crop')),
+        'detector': DetectorConfig.from_camera(camera),
+    }
+
+def _attendance_response_data(employee, action, punch_time):
+    """JSON payload for the kiosk after a check-in/check-out attempt (see record_face_attendance)"""
+    if action == 'check_in':
+        # First check-in for the day
+        return {
+            'success': True,
+            'message': f'Đã điểm danh giờ vào thành công: {employee.first_name} {employee.last_name}',
+            'check_in': True,
+            'check_out': False,
+            'check_in_time': punch_time.strftime('%H:%M:%S')
+        }
+    if action == 'check_out':
+        return {
+            'success': True,
+            'message': f'Đã điểm danh giờ ra thành công: {employee.first_name} {employee.last_name}',
+            'check_in': False,
+            'check_out': True,
+            'check_out_time': punch_time.strftime('%H:%M:%S')
+        }
+    # Already checked out
+    return {
+        'success': False,
+        'message': f'Bạn đã điểm danh đủ cả vào và ra hôm nay.',
+        'check_in': True,
+        'check_out': True
+    }
+
+def _recognition_unavailable(error):
+    """503/504 response telling the kiosk to retry when the worker pool is saturated"""
+    busy = isinstance(error, RecognitionBusy)
+    response = JsonResponse({
+        'success': False,
+        'message': 'Hệ thống đang bận, vui lòng thử lại sau giây lát.' if busy
+                   else 'Nhận diện quá thời gian, vui lòng thử lại.'
+    }, status=503 if busy else 504)
+    response['Retry-After'] = '1'
+    return response
+
+def _camera_from_request(data):
+    """CameraConfiguration named by the request's camera_id, if any"""
+    camera_id = data.get('camera_id')
+    if not camera_id:
+        return None
+    return CameraConfiguration.objects.filter(pk=camera_id).first()
+
+@login_required
+@require_POST
+def mark_attendance_batch(request):
+    """
+    Recognise every face in several frames with one gallery lookup.
+    Body: multipart with one ``frames`` file per frame and an optional
+    ``camera_id`` field, or JSON {"frames": [<base64 JPEG>, ...], "camera_id": ...}.
+    Each matched employee gets one attendance event, all written together
+    (see record_face_attendance_many). The response lists every detected
+    face with its own match; ``recorded`` marks the face (the employee's
+    closest) whose match was used for the attendance event.
+    """
+    try:
+        if request.content_type == 'multipart/form-data':
+            data = request.POST
+            frames = [upload.read() for upload in request.FILES.getlist('frames')]
+        else:
+            data = json.loads(request.body)
+            frames = [_image_bytes(image_data) for image_data in data.get('frames') or []]
+        max_frames = getattr(settings, 'FACE_BATCH_MAX_FRAMES', 10)
+        if not frames:
+            return JsonResponse({'success': False, 'message': 'Không có ảnh nào được gửi.'}, status=400)
+        if len(frames) > max_frames:
+            return JsonResponse({
+                'success': False,
+                'message': f'Tối đa {max_frames} ảnh mỗi yêu cầu.'
+            }, status=400)
+
+        # Detect and encode every face of every frame, frames in parallel
+        camera = _camera_from_request(data)
+        frame_faces = get_recognition_service().encode_faces_many(
+            frames, _detection_options(camera, data)
+        )
+        faces = []
+        encodings = []
+        for frame_index, detected in enumerate(frame_faces):
+            for face in detected or []:
+                faces.append({'frame': frame_index, 'box': list(face.location)})
+                encodings.append(face.encoding)
+
+        if not faces:
+            return JsonResponse({
+                'success': False,
+                'message': 'No face detected. Please position yourself properly.',
+                'results': []
+            })
+
+        # One matrix operation matches all faces against the gallery
+        tolerance = camera.threshold if camera else DEFAULT_TOLERANCE
+        matches = gallery.match_many(encodings, tolerance, department_ids=recognition_scope(camera))
+
+        # The same person usually appears in several frames: keep their closest face
+        best_face = {}
+        for face_index, (employee_id, distance) in enumerate(matches):
+            if employee_id is not None and (
+                employee_id not in best_face or distance < matches[best_face[employee_id]][1]
+            ):
+                best_face[employee_id] = face_index
+
+        employees = Employee.objects.in_bulk(list(best_face))
+        for face_index, (employee_id, distance) in enumerate(matches):
+            employee = employees.get(employee_id)
+            faces[face_index].update({
+                'employee_id': employee.employee_id if employee else None,
+                'name': f'{employee.first_name} {employee.last_name}' if employee else None,
+                'distance': distance,
+                'recorded': False,
+                'action': None,
+            })
+
+        recorded = [
+            (employees[employee_id], face_index)
+            for employee_id, face_index in best_face.items() if employee_id in employees
+        ]
+        results = record_face_attendance_many(
+            [(employee, matches[face_index][1]) for employee, face_index in recorded],
+            timezone.now(), camera=camera,
+        )
+        for (employee, face_index), (action, _, _) in zip(recorded, results):
+            faces[face_index].update({'recorded': True, 'action': action})
+
+        return JsonResponse({
+            'success': bool(recorded),
+            'message': f'Đã nhận diện {len(recorded)} nhân viên.',
+            'results': faces
+        })
+
+    except (RecognitionBusy, RecognitionTimeout) as e:
+        return _recognition_unavailable(e)
+    except Exception as e:
+        import traceback
+        print(f"Error in mark_attendance_batch: {e}")
+        print(traceback.format_exc())
+        return JsonResponse({
+            'success': False,
+            'message': f'Đã xảy ra lỗi: {str(e)}'
+        })
+
+
+@login_required
+async def mark_attendance_async(request):
+    """
+    Async variant of mark_attendance for ASGI deployments
+    (e.g. ``uvicorn attendance_system.asgi:application``).
+    Recognition runs in the worker pool and the attendance upsert uses the
+    async ORM, so waiting kiosks do not each hold a server thread.
+    """
+    if request.method != 'POST':
+        # The page itself is cheap; reuse the synchronous view to render it
+        return await sync_to_async(mark_attendance)(request)
+
+    try:
+        image_bytes, data = _recognition_payload(request)
+        camera = None
+        if data.get('camera_id'):
+            camera = await CameraConfiguration.objects.filter(pk=data['camera_id']).afirst()
+        cache_key = recognition_cache.cache_key(image_bytes, camera)
+        cached = await recognition_cache.aget(cache_key)
+        if cached is not None:
+            return JsonResponse(cached)
+        faces = await get_recognition_service().aencode_faces(
+            image_bytes, _detection_options(camera, data)
+        )
+
+        if faces is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'Không đọc được ảnh. Vui lòng thử lại.'
+            })
+        if not faces:
+            return JsonResponse(await recognition_cache.aremember(cache_key, {
+                'success': False,
+                'message': 'No face detected. Please position yourself properly.'
+            }))
+
+        tolerance = camera.threshold if camera else DEFAULT_TOLERANCE
+        department_ids = await sync_to_async(recognition_scope)(camera)
+        employee_id, distance = await sync_to_async(gallery.match)(
+            faces[0].encoding, tolerance, department_ids=department_ids
+        )
+
+        if employee_id is None:
+            return JsonResponse(await recognition_cache.aremember(cache_key, {
+                'success': False,
+                'message': 'Không tìm thấy khuôn mặt nào trùng khớp. Vui lòng thử lại.'
+            }))
+
+        matched_employee = await Employee.objects.aget(pk=employee_id)
+        action, _, punch_time = await arecord_face_attendance(
+            matched_employee, timezone.now(), camera=camera, distance=distance
+        )
+        return JsonResponse(await recognition_cache.aremember(
+            cache_key, _attendance_response_data(matched_employee, action, punch_time)
+        ))
+
+    except (RecognitionBusy, RecognitionTimeout) as e:
+        return _recognition_unavailable(e)
+    except Exception as e:
+        import traceback
+        print(f"Error in mark_attendance_async: {e}")
+        print(traceback.format_exc())
+        return JsonResponse({
+            'success': False,
+            'message': f'Đã xảy ra lỗi: {str(e)}'
+        })
+
+
+@login_required
+def attendance_buffer_stats(request):
+    """Write-behind punch buffer metrics: queue depth and flush latency"""
+    if not write_behind():
+        return JsonResponse({'enabled': False})
+    return JsonResponse({'enabled': True, **get_buffer().stats()})
+
+
 # def index(request):
 #     """Landing page view"""
 #     return render(request, 'face_attendance/index.html')
@@ -212,6 +433,30 @@ def employee_list(request):
     }
     return render(request, 'face_attendance/employee_list.html', context)
 
+# Rows fetched per server-side cursor round trip by the CSV exports
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object for csv.writer: write() returns the line instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def _streaming_csv(filename, header, rows):
+    """Stream ``rows`` as a CSV download; nothing is built up in memory"""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield '\ufeff'  # BOM so Excel reads the file as UTF-8
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
 def emp_attendance_list(request):
     """View for employee attendance records with optional CSV export"""
     employees = Employee.objects.filter(is_active=True)
@@ -234,32 +479,27 @@ def emp_attendance_list(request):
 
     # CSV Export logic
     if download == 'true':
-        response = HttpResponse(content_type='text/csv', charset='utf-8-sig')
-        response['Content-Disposition'] = f'attachment; filename={today} attendance_report.csv'
-
-        writer = csv.writer(response)
-        writer.writerow([
+        rows = attendance_records.values_list(
+            'employee__first_name', 'employee__last_name', 'employee__employee_id',
+            'employee__department__name', 'employee__position',
+            'date', 'check_in_time', 'check_out_time',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return _streaming_csv(f'{today} attendance_report.csv', [
             'Emp Name', 'Emp ID', 'Department', 'Position',
             'Date', 'Check-in Time', 'Check-out Time', 'Stayed Time'
-        ])
-
-        for record in attendance_records:
-            check_in = record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else 'N/A'
-            check_out = record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else 'N/A'
-            stayed = record.calculate_duration if (record.check_in_time and record.check_out_time) else 'Incomplete'
-
-            writer.writerow([
-                f"{record.employee.first_name} {record.employee.last_name}",
-                record.employee.employee_id,
-                record.employee.department.name if record.employee.department else '',
-                record.employee.position,
-                record.date,
-                check_in,
-                check_out,
-                stayed
-            ])
-
-        return response
+        ], (
+            [
+                f"{first_name} {last_name}",
+                employee_id,
+                department or '',
+                position,
+                date,
+                check_in.strftime('%H:%M:%S') if check_in else 'N/A',
+                check_out.strftime('%H:%M:%S') if check_out else 'N/A',
+                AttendanceRecord.format_duration(check_in, check_out) or 'Incomplete',
+            ]
+            for first_name, last_name, employee_id, department, position, date, check_in, check_out in rows
+        ))
 
     # Render template with latest 30 records
     context = {
@@ -278,10 +518,7 @@ def dashboard(request):
     
     # Count stats for today
     total_employees = Employee.objects.filter(is_active=True).count()
-    present_today = AttendanceRecord.objects.filter(
-        date=today, 
-        status__in=['present', 'late']
-    ).count()
+    present_today = day_counts(today)['present']
     absent_today = total_employees - present_today
     
     departments = Department.objects.all()
@@ -384,20 +621,17 @@ def register_face(request):
             
             # Process the image based on capture method
             if capture_method == 'camera':
-                # Process webcam capture
+                # Process webcam capture: a JPEG file from canvas.toBlob, or
+                # the older base64 data URL in image_data
                 image_data = request.POST.get('image_data')
-                if not image_data:
+                if 'image_file' in request.FILES:
+                    image_bytes = request.FILES['image_file'].read()
+                elif image_data:
+                    image_bytes = _image_bytes(image_data)
+                else:
                     messages.error(request, "No image data received")
                     return render(request, 'face_attendance/register_face.html', context)
                 
-                # Process the base64 image data
-                image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-                
-                # Convert to numpy array for face_recognition
-                np_arr = np.frombuffer(image_bytes, np.uint8)
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-                
             else:  # upload method
                 if 'photo' not in request.FILES:
                     messages.error(request, "No file uploaded")
@@ -405,32 +639,21 @@ def register_face(request):
                 
                 # Process the uploaded file
                 uploaded_file = request.FILES['photo']
-                
-                # Convert to numpy array for face_recognition
-                file_bytes = uploaded_file.read()
-                np_arr = np.frombuffer(file_bytes, np.uint8)
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                image_bytes = uploaded_file.read()
             
-            # Use face_recognition to find faces in the image
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_img)
+            # Detect and encode faces in the recognition worker pool
+            faces = get_recognition_service().encode_faces(image_bytes)
             
-            if not face_locations:
+            if not faces:
                 messages.error(request, "No face detected in the image. Please try again.")
                 return render(request, 'face_attendance/register_face.html', context)
             
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(rgb_img, face_locations)
-            
-            if not face_encodings:
-                messages.error(request, "Could not encode the face. Please try again.")
-                return render(request, 'face_attendance/register_face.html', context)
-            
             # Create a new face encoding
-            encoding = face_encodings[0]  # Get the first face encoding
+            encoding = faces[0].encoding  # Get the first face encoding
             
             # Set any existing face encodings for this employee to not primary
             FaceEncoding.objects.filter(employee=employee, is_primary=True).update(is_primary=False)
+            notify_changed(employee.pk)  # update() bypasses the post_save signal
             
             # Create new face encoding
             face_encoding = FaceEncoding(employee=employee, is_primary=True)
@@ -452,6 +675,8 @@ def register_face(request):
             
         except Employee.DoesNotExist:
             messages.error(request, "Employee not found")
+        except (RecognitionBusy, RecognitionTimeout):
+            messages.error(request, "Hệ thống nhận diện đang bận. Vui lòng thử lại sau giây lát.")
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
     
@@ -654,26 +879,39 @@ def work_units_list(request):
                 employee_id__icontains=search_query
             )
         
-        # Lấy thông tin ngày công cho mỗi nhân viên
+        # Lấy thông tin ngày công của tất cả nhân viên trong một truy vấn
+        employees = with_summary_totals(employees, date_from, date_to)
+        
+        if request.GET.get('download_report') == 'true':
+            # Sorted by the database so rows can be streamed as they are read
+            rows = employees.order_by('-total_work_units', 'id').values_list(
+                'employee_id', 'first_name', 'last_name', 'department__name',
+                'total_hours', 'total_work_units', 'daily_rate',
+            ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            return _streaming_csv(f'work_units_report_{date_from}_to_{date_to}.csv', [
+                'Mã NV', 'Tên Nhân Viên', 'Phòng Ban', 'Tổng Giờ Làm Việc', 
+                'Tổng Công', 'Mức Lương Ngày', 'Lương Dự Kiến'
+            ], (
+                [
+                    employee_id,
+                    f"{first_name} {last_name}",
+                    department or 'N/A',
+                    round(total_hours, 2),
+                    round(total_work_units, 2),
+                    float(daily_rate) if daily_rate else 0.0,
+                    round(pay_breakdown(total_work_units, daily_rate)[0], 2),
+                ]
+                for employee_id, first_name, last_name, department, total_hours, total_work_units, daily_rate in rows
+            ))
+        
         employee_work_data = []
-        for employee in employees:
-            records = AttendanceRecord.objects.filter(
-                employee=employee,
-                date__range=[date_from, date_to]
-            )
-            
-            total_hours = sum(record.hours_worked or 0 for record in records)
-            total_work_units = sum(record.work_units or 0 for record in records)
-            
-            # Chuyển đổi sang cùng kiểu dữ liệu trước khi thực hiện phép nhân
-            daily_rate = Decimal(str(employee.daily_rate)) if employee.daily_rate else Decimal('0')
-            total_work_units = Decimal(str(total_work_units)) if total_work_units else Decimal('0')
-            estimated_salary = daily_rate * total_work_units
+        for employee in employees.select_related('department'):
+            estimated_salary, _, _ = pay_breakdown(employee.total_work_units, employee.daily_rate)
             
             employee_work_data.append({
                 'employee': employee,
-                'total_hours': round(total_hours, 2),
-                'total_work_units': round(total_work_units, 2),
+                'total_hours': round(employee.total_hours, 2),
+                'total_work_units': round(employee.total_work_units, 2),
                 'estimated_salary': round(estimated_salary, 2)
             })
         
@@ -687,29 +925,6 @@ def work_units_list(request):
             'date_to': date_to,
         }
         
-        if request.GET.get('download_report') == 'true':
-            response = HttpResponse(content_type='text/csv', charset='utf-8-sig')
-            response['Content-Disposition'] = f'attachment; filename=work_units_report_{date_from}_to_{date_to}.csv'
-            
-            writer = csv.writer(response)
-            writer.writerow([
-                'Mã NV', 'Tên Nhân Viên', 'Phòng Ban', 'Tổng Giờ Làm Việc', 
-                'Tổng Công', 'Mức Lương Ngày', 'Lương Dự Kiến'
-            ])
-            
-            for data in employee_work_data:
-                writer.writerow([
-                    data['employee'].employee_id,
-                    f"{data['employee'].first_name} {data['employee'].last_name}",
-                    data['employee'].department.name if data['employee'].department else 'N/A',
-                    data['total_hours'],
-                    data['total_work_units'],
-                    float(data['employee'].daily_rate) if data['employee'].daily_rate else 0.0,
-                    data['estimated_salary']
-                ])
-            
-            return response
-        
         return render(request, 'face_attendance/work_units_list.html', context)
     except Exception as e:
         messages.error(request, f"Lỗi khi hiển thị danh sách ngày công: {str(e)}")
@@ -729,31 +944,47 @@ def salary_calculator(request):
         if not date_to:
             date_to = today.strftime('%Y-%m-%d')  # Ngày hiện tại
         
-        employees = Employee.objects.filter(is_active=True)
+        employees = with_summary_totals(
+            Employee.objects.filter(is_active=True), date_from, date_to
+        )
+        
+        if request.GET.get('download_report') == 'true':
+            # Lương gộp = số công x lương ngày; sorted by the database so rows can be streamed
+            gross_pay = ExpressionWrapper(
+                F('total_work_units') * F('daily_rate'), output_field=DecimalField(max_digits=20, decimal_places=4)
+            )
+            rows = employees.order_by(gross_pay.desc(), 'id').values_list(
+                'employee_id', 'first_name', 'last_name', 'department__name', 'total_work_units', 'daily_rate',
+            ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            
+            def salary_rows():
+                for employee_id, first_name, last_name, department, total_work_units, daily_rate in rows:
+                    salary, deductions, net_salary = pay_breakdown(total_work_units, daily_rate)
+                    yield [
+                        employee_id,
+                        f"{first_name} {last_name}",
+                        department or 'N/A',
+                        round(total_work_units, 2),
+                        round(salary, 2),
+                        round(deductions, 2),
+                        round(net_salary, 2),
+                    ]
+            
+            return _streaming_csv(f'salary_report_{date_from}_to_{date_to}.csv', [
+                'Mã NV', 'Tên Nhân Viên', 'Phòng Ban', 'Tổng Công', 
+                'Lương Gộp', 'Khấu Trừ', 'Lương Thực Nhận'
+            ], salary_rows())
         
         # Tính toán lương cho mỗi nhân viên
         salary_data = []
         total_salary = 0
         
-        for employee in employees:
-            records = AttendanceRecord.objects.filter(
-                employee=employee,
-                date__range=[date_from, date_to]
-            )
-            
-            total_work_units = sum(record.work_units or 0 for record in records)
-            
-            # Chuyển đổi sang cùng kiểu dữ liệu trước khi thực hiện phép nhân
-            daily_rate = Decimal(str(employee.daily_rate)) if employee.daily_rate else Decimal('0')
-            total_work_units_float = Decimal(str(total_work_units)) if total_work_units else Decimal('0')
-            
-            salary = daily_rate * total_work_units_float
-            deductions = salary * Decimal('0.2')  # Khấu trừ 20% (thuế + bảo hiểm)
-            net_salary = salary - deductions
+        for employee in employees.select_related('department'):
+            salary, deductions, net_salary = pay_breakdown(employee.total_work_units, employee.daily_rate)
             
             salary_data.append({
                 'employee': employee,
-                'total_work_units': round(total_work_units_float, 2),
+                'total_work_units': round(employee.total_work_units, 2),
                 'salary': round(salary, 2),
                 'deductions': round(deductions, 2),
                 'net_salary': round(net_salary, 2)
@@ -771,29 +1002,6 @@ def salary_calculator(request):
             'total_salary': round(total_salary, 2)
         }
         
-        if request.GET.get('download_report') == 'true':
-            response = HttpResponse(content_type='text/csv', charset='utf-8-sig')
-            response['Content-Disposition'] = f'attachment; filename=salary_report_{date_from}_to_{date_to}.csv'
-            
-            writer = csv.writer(response)
-            writer.writerow([
-                'Mã NV', 'Tên Nhân Viên', 'Phòng Ban', 'Tổng Công', 
-                'Lương Gộp', 'Khấu Trừ', 'Lương Thực Nhận'
-            ])
-            
-            for data in salary_data:
-                writer.writerow([
-                    data['employee'].employee_id,
-                    f"{data['employee'].first_name} {data['employee'].last_name}",
-                    data['employee'].department.name if data['employee'].department else 'N/A',
-                    data['total_work_units'],
-                    data['salary'],
-                    data['deductions'],
-                    data['net_salary']
-                ])
-            
-            return response
-        
         return render(request, 'face_attendance/salary_calculator.html', context)
     except Exception as e:
         messages.error(request, f"Lỗi khi tính toán lương: {str(e)}")
@@ -802,7 +1010,7 @@ def salary_calculator(request):
 @login_required
 def employee_salary(request, employee_id):
     """Hiển thị chi tiết tính lương cho nhân viên cụ thể"""
-    employee = get_object_or_404(Employee, employee_id=employee_id)
+    employee = get_object_or_404(Employee.objects.select_related('department'), employee_id=employee_id)
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
     
@@ -820,12 +1028,11 @@ def employee_salary(request, employee_id):
     ).order_by('date')
     
     # Tính tổng số công và lương
-    total_hours = sum(record.hours_worked for record in attendance_records)
-    total_work_units = sum(record.work_units for record in attendance_records)
+    totals = record_totals(attendance_records)
+    total_hours = totals['total_hours']
+    total_work_units = totals['total_work_units']
     
-    salary = total_work_units * employee.daily_rate
-    deductions = salary * Decimal('0.2')  # Khấu trừ 20% (thuế + bảo hiểm) - Convert float to Decimal
-    net_salary = salary - deductions
+    salary, deductions, net_salary = pay_breakdown(total_work_units, employee.daily_rate)
     
     context = {
         'employee': employee,
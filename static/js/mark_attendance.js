@@ -26,6 +26,10 @@ document.addEventListener('DOMContentLoaded', function() {
     // Video stream
     let stream = null;
 
+    // Kiosks open this page as /attendance/?camera=<id> so recognition
+    // searches that camera's department first
+    const cameraId = new URLSearchParams(window.location.search).get('camera');
+
     // Start camera
     startButton.addEventListener('click', async function() {
         try {
@@ -115,25 +119,26 @@ document.addEventListener('DOMContentLoaded', function() {
         const context = canvas.getContext('2d');
         context.drawImage(video, 0, 0, canvas.width, canvas.height);
         
-        // Convert to base64
-        const imageData = canvas.toDataURL('image/jpeg', 0.9);
-        
-        // Send to server
-        sendImageToServer(imageData);
+        // Encode as JPEG bytes and send them as-is (no base64)
+        canvas.toBlob(sendImageToServer, 'image/jpeg', 0.9);
     }
 
-    // Send image to server
-    async function sendImageToServer(imageData) {
+    // Send image to server as a raw image/jpeg body; options go in the query string
+    async function sendImageToServer(imageBlob) {
         try {
             const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+            const url = new URL(window.location.pathname, window.location.origin);
+            if (cameraId) {
+                url.searchParams.set('camera_id', cameraId);
+            }
             
-            const response = await fetch(window.location.href, {
+            const response = await fetch(url, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
+                    'Content-Type': 'image/jpeg',
                     'X-CSRFToken': csrfToken
                 },
-                body: JSON.stringify({ image_data: imageData })
+                body: imageBlob
             });
             
             const data = await response.json();
@@ -41,6 +41,7 @@
         const video = document.getElementById('video');
         const canvas = document.getElementById('canvas');
         const imageDataInput = document.getElementById('image_data');
+        const imageFileInput = document.getElementById('image_file');
         const cameraForm = document.getElementById('cameraForm');
         const imagePreview = document.getElementById('imagePreview');
         let stream = null;
@@ -101,20 +102,33 @@
                 return;
             }
             
-            captureImage();
-            // Submit the form programmatically
-            cameraForm.submit();
+            // Submit the form programmatically once the image is attached
+            captureImage(() => cameraForm.submit());
         });
 
-        // Function to capture image from camera
-        function captureImage() {
+        // Function to capture image from camera: the JPEG is attached as a
+        // file (image_file) rather than a base64 data URL where supported
+        function captureImage(onCaptured) {
             canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
-            const dataURL = canvas.toDataURL('image/jpeg');
-            imageDataInput.value = dataURL;
-
-            // Show the captured image preview
-            imagePreview.src = dataURL;
-            imagePreview.style.display = 'block';
+            if (typeof DataTransfer === 'undefined') {
+                const dataURL = canvas.toDataURL('image/jpeg');
+                imageDataInput.value = dataURL;
+                imagePreview.src = dataURL;
+                imagePreview.style.display = 'block';
+                if (onCaptured) onCaptured();
+                return;
+            }
+            canvas.toBlob(blob => {
+                const transfer = new DataTransfer();
+                transfer.items.add(new File([blob], 'capture.jpg', { type: 'image/jpeg' }));
+                imageFileInput.files = transfer.files;
+                imageDataInput.value = '';
+
+                // Show the captured image preview
+                imagePreview.src = URL.createObjectURL(blob);
+                imagePreview.style.display = 'block';
+                if (onCaptured) onCaptured();
+            }, 'image/jpeg', 0.9);
         }
         
         // Add keyboard listener for spacebar and q